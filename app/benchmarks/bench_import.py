@@ -0,0 +1,61 @@
+"""Throughput of the bulk customer import (validation + COPY + merge).
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/bench_import.py [--rows 50000] [--format ndjson]
+
+The imported customers are rolled back afterwards, so it can be pointed at a development database.
+"""
+import argparse, io, json, os, sys, time, uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sql_app import crud, database, imports
+
+FIELDS = ["full_name", "contact_email", "birthdate", "national_id_number", "passport_number", "tin_number", "country_of_origin", "denied_visa"]
+
+
+def synthetic_file(rows: int, file_format: str) -> bytes:
+    run = uuid.uuid4().hex[:8]
+    records = [
+        {
+            "full_name": f"Customer {i}", "contact_email": f"customer{i}@example.com", "birthdate": "1980-01-01",
+            "national_id_number": None, "passport_number": f"bench-{run}-{i}", "tin_number": None,
+            # One row in a hundred is rejected by validation
+            "country_of_origin": "PT" if i % 100 == 99 else "Portugal", "denied_visa": False,
+        }
+        for i in range(rows)
+    ]
+    if file_format == "csv":
+        lines = [",".join(FIELDS)] + [",".join("" if record[field] is None else str(record[field]) for field in FIELDS) for record in records]
+        return "\n".join(lines).encode()
+    return "\n".join(json.dumps(record) for record in records).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+
+    data = synthetic_file(args.rows, args.format)
+    db = database.SessionLocal()
+    if db.get_bind().dialect.name != "postgresql":
+        sys.exit("The bulk import requires a PostgreSQL DATABASE_URL")
+    try:
+        started = time.perf_counter()
+        rows = imports.iter_customers(io.BytesIO(data), f"customers.{args.format}")
+        # Same work as the endpoint, but rolled back instead of committed
+        db.commit = db.flush
+        report = crud.import_customers(db, rows)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.rollback()
+        db.close()
+
+    print(f"rows:      {args.rows} ({len(data) / 1e6:.1f} MB {args.format})")
+    print(f"inserted:  {report['inserted']}, rejected: {len(report['errors'])}")
+    print(f"elapsed:   {elapsed:.2f} s")
+    print(f"rows/s:    {args.rows / elapsed:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
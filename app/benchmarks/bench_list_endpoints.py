@@ -0,0 +1,119 @@
+"""Rows per second and peak memory of the list endpoints, ORM objects versus the column-projected fast path.
+
+Usage: python benchmarks/bench_list_endpoints.py [--rows 10000] [--repeat 5]
+
+Seeds a throwaway SQLite database and times query + validation + JSON serialization of one
+page of --rows rows per endpoint, the same work the endpoint does before sending the response.
+"""
+import argparse, base64, os, random, statistics, sys, tempfile, time, tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+_db_dir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir.name, 'bench.db')}"
+os.environ.pop("REPLICA_DATABASE_URLS", None)
+
+from pydantic import TypeAdapter
+from sql_app import crud, database, models, schemas
+
+
+def seed(rows: int):
+    models.Base.metadata.create_all(bind=database.engine)
+    rng = random.Random(42)
+    db = database.SessionLocal()
+    try:
+        db.add_all(models.Partner(
+            id=i, company_name=f"Clinic {i}", website=f"https://clinic{i}.example", help_type="dental",
+            small_description="Implants and crowns", large_description="Full mouth rehabilitation " * 10,
+            logo=rng.randbytes(512)
+        ) for i in range(1, rows + 1))
+        db.add_all(models.Surgery(
+            id=i, surgery=f"Surgery {i}", surgery_description="Hair transplant, FUE technique", partner_id=i
+        ) for i in range(1, rows + 1))
+        db.add_all(models.TierList(
+            id=i, tier="Gold", surgery_id=i, visa_sponsorship="yes", flight_type="business",
+            number_family_members="2", hospital_accommodations="private room", hotel="5 stars",
+            duration_stay="10 days", tourism_package="Porto and Douro", post_surgery_monitoring="6 months",
+            price=f"{rng.randint(1000, 9000)} EUR"
+        ) for i in range(1, rows + 1))
+        db.add_all(models.Customer(
+            id=i, full_name=f"Customer {i}", contact_email=f"customer{i}@example.com", birthdate=date(1980, 1, 1),
+            national_id_number=f"N{i}", passport_number=f"P{i}", tin_number=f"T{i}",
+            country_of_origin="PT", denied_visa=False
+        ) for i in range(1, rows + 1))
+        db.commit()
+    finally:
+        db.close()
+
+
+# The ORM queries the list endpoints ran before the fast path
+def orm_partners(db, skip, limit):
+    return [
+        {
+            "id": partner.id, "company_name": partner.company_name, "website": partner.website,
+            "help_type": partner.help_type, "small_description": partner.small_description,
+            "large_description": partner.large_description,
+            "logo": base64.b64encode(partner.logo).decode('utf-8') if partner.logo else None
+        }
+        for partner in db.query(models.Partner).offset(skip).limit(limit).all()
+    ]
+
+
+ENDPOINTS = [
+    ("/surgeries", list[schemas.Surgery],
+     lambda db, skip, limit: db.query(models.Surgery).order_by(models.Surgery.id).offset(skip).limit(limit).all(),
+     crud.get_surgeries),
+    ("/tier-lists", list[schemas.TierList],
+     lambda db, skip, limit: db.query(models.TierList).offset(skip).limit(limit).all(),
+     crud.get_tier_lists),
+    ("/partners", list[schemas.Partner], orm_partners, crud.get_partner_lists),
+    ("/customers/", list[schemas.CustomerResponse],
+     lambda db, skip, limit: db.query(models.Customer).offset(skip).limit(limit).all(),
+     crud.get_customers),
+]
+
+
+def render(adapter: TypeAdapter, load, rows: int) -> bytes:
+    db = database.SessionLocal()
+    try:
+        return adapter.dump_json(adapter.validate_python(load(db, 0, rows), from_attributes=True))
+    finally:
+        db.close()
+
+
+def measure(adapter: TypeAdapter, load, rows: int, repeat: int):
+    body = render(adapter, load, rows)  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render(adapter, load, rows)
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    render(adapter, load, rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(samples), peak, body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    print(f"rows per request: {args.rows}")
+    print(f"{'endpoint':<14}{'path':<6}{'rows/s':>12}{'ms':>10}{'peak MB':>10}")
+    for name, response_type, orm_load, fast_load in ENDPOINTS:
+        adapter = TypeAdapter(response_type)
+        orm_time, orm_peak, orm_body = measure(adapter, orm_load, args.rows, args.repeat)
+        fast_time, fast_peak, fast_body = measure(adapter, fast_load, args.rows, args.repeat)
+        assert orm_body == fast_body, f"{name}: fast path response differs"
+        for label, elapsed, peak in (("orm", orm_time, orm_peak), ("core", fast_time, fast_peak)):
+            print(f"{name:<14}{label:<6}{args.rows / elapsed:>12,.0f}{elapsed * 1000:>10.1f}{peak / 1e6:>10.2f}")
+        print(f"{'':<14}{'':<6}{orm_time / fast_time:>11.1f}x{'':>10}{orm_peak / fast_peak:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compression ratio and read latency of the document storage codec.
+
+Usage: python benchmarks/bench_storage.py [corpus_dir] [--codec zstd] [--level 3]
+
+Without a corpus directory a synthetic set of text-heavy PDFs and noisy scans is generated.
+"""
+import argparse, os, random, statistics, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sql_app import storage
+
+
+def synthetic_corpus(count: int = 20):
+    rng = random.Random(42)
+    words = ["patient", "visa", "dossier", "implant", "clinic", "Braga", "insurance", "passport", "surgery", "follow-up"]
+    corpus = []
+    for i in range(count):
+        if i % 4 == 3:
+            # Scanned images are close to incompressible
+            corpus.append((f"scan_{i}.jpg", rng.randbytes(rng.randint(200_000, 800_000))))
+        else:
+            body = " ".join(rng.choice(words) for _ in range(rng.randint(50_000, 200_000)))
+            corpus.append((f"form_{i}.pdf", b"%PDF-1.7\n" + body.encode() + b"\n%%EOF"))
+    return corpus
+
+
+def load_corpus(path: str):
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        if os.path.isfile(full_path):
+            with open(full_path, "rb") as f:
+                corpus.append((name, f.read()))
+    return corpus
+
+
+def timed(fn, *args, repeat: int = 5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", nargs="?")
+    parser.add_argument("--codec", default="zstd")
+    parser.add_argument("--level", type=int, default=storage.ZSTD_LEVEL)
+    args = parser.parse_args()
+
+    storage.ZSTD_LEVEL = args.level
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+
+    raw_total = stored_total = 0
+    write_total = raw_read_total = decoded_read_total = 0.0
+    for name, data in corpus:
+        stored = storage.encode(data, args.codec)
+        raw_total += len(data)
+        stored_total += len(stored)
+        write_total += timed(storage.encode, data, args.codec)
+        raw_read_total += timed(lambda: b"".join(storage.iter_decoded(data)))
+        decoded_read_total += timed(lambda: b"".join(storage.iter_decoded(stored)))
+
+    print(f"files:             {len(corpus)}")
+    print(f"raw size:          {raw_total / 1e6:.2f} MB")
+    print(f"stored size:       {stored_total / 1e6:.2f} MB")
+    print(f"compression ratio: {raw_total / stored_total:.2f}x")
+    print(f"encode time:       {write_total * 1000:.1f} ms ({raw_total / write_total / 1e6:.0f} MB/s)")
+    print(f"read raw:          {raw_read_total * 1000:.1f} ms")
+    print(f"read decoded:      {decoded_read_total * 1000:.1f} ms (+{(decoded_read_total - raw_read_total) * 1000 / len(corpus):.2f} ms per file)")
+
+
+if __name__ == "__main__":
+    main()
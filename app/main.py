@@ -1,19 +1,21 @@
-import logging, os, aiosmtplib, base64
-from fastapi import FastAPI, HTTPException, Depends, APIRouter, Path, UploadFile, File, status
+import logging, os, time, json, aiosmtplib, base64
+from fastapi import FastAPI, HTTPException, Depends, APIRouter, BackgroundTasks, Path, Query, Request, UploadFile, File, status
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 from sqlalchemy.future import select
+from sqlalchemy.exc import DBAPIError, OperationalError
+from pydantic import TypeAdapter
 from dotenv import load_dotenv
-from sql_app import models, crud, schemas, database, auth
+from sql_app import models, crud, schemas, database, auth, storage, export, imports, profiling, idempotency, pdf_pipeline, logs, singleflight, cache, admission, cancellation
 from email.message import EmailMessage
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from io import BytesIO
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sql_app.auth import authenticate_user, create_access_token, get_current_user
 
 
-logging.basicConfig(level=logging.INFO)
+logs.setup_logging()
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -21,14 +23,54 @@ load_dotenv()
 models.Base.metadata.create_all(bind=database.engine)
 
 app = FastAPI()
-
-def get_db():
-    db = database.SessionLocal()
+app.router.route_class = profiling.ProfiledRoute
+
+@app.on_event("startup")
+def start_pdf_pipeline():
+    if pdf_pipeline.worker is not None:
+        pdf_pipeline.worker.start()
+
+@app.on_event("shutdown")
+def stop_pdf_pipeline():
+    if pdf_pipeline.worker is not None:
+        pdf_pipeline.worker.stop()
+
+# One session per request, shared with get_current_user, with the route's statement timeout
+get_db = database.get_db
+
+# Concurrent identical reads share one query and one serialization
+shared_reads = singleflight.SingleFlight()
+SURGERY_WITH_LOGO = TypeAdapter(schemas.SurgeryWithLogo)
+SURGERY_LIST = TypeAdapter(list[schemas.Surgery])
+TIER_LIST_LIST = TypeAdapter(list[schemas.TierList])
+PARTNER_LIST = TypeAdapter(list[schemas.Partner])
+CUSTOMER_LIST = TypeAdapter(list[schemas.CustomerResponse])
+
+def load_json(route: str, adapter: TypeAdapter, load, pin_primary: bool, *args) -> bytes | None:
+    # Shared between requests, so it is not cancelled when one of their clients disconnects
+    db = database.read_session(pin_primary=pin_primary, statement_timeout_ms=database.statement_timeout_for(route))
     try:
-        yield db
+        result = load(db, *args)
+        if result is None:
+            return None
+        with profiling.serializing():
+            return adapter.dump_json(adapter.validate_python(result, from_attributes=True))
     finally:
         db.close()
 
+@profiling.profile_in_thread
+def load_catalog_json(route: str, adapter: TypeAdapter, load, pin_primary: bool, *args) -> bytes | None:
+    # Cache fills read from the primary so a lagging replica can't store stale rows under a fresh version
+    return cache.get_or_set(
+        cache.CATALOG, (route, *args),
+        lambda: load_json(route, adapter, load, pin_primary or cache.enabled(), *args)
+    )
+
+def catalog_changed(background_tasks: BackgroundTasks):
+    # Invalidate before responding so the writer's next read misses on every replica
+    cache.invalidate(cache.CATALOG)
+    background_tasks.add_task(crud.refresh_surgery_summary)
+
 origins = [
     "http://localhost:3000",
     "localhost:3000",
@@ -39,6 +81,27 @@ origins = [
     "https://www.nugomed.com"
 ]
 
+async def pin_primary_after_write(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(
+            database.PRIMARY_PIN_COOKIE,
+            str(time.time() + database.READ_YOUR_WRITES_SECONDS),
+            max_age=database.READ_YOUR_WRITES_SECONDS,
+            httponly=True
+        )
+    return response
+
+if database.replica_engines:
+    app.middleware("http")(pin_primary_after_write)
+
+profiling.install_sql_timing(database.engine, *database.replica_engines)
+# Idempotency runs inside profiling, so a profiled request stores its real response for retries
+app.add_middleware(idempotency.IdempotencyMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(cancellation.CancelOnDisconnectMiddleware)
+app.add_middleware(admission.AdmissionMiddleware)
+
 app.add_middleware(
 CORSMiddleware,
     allow_origins=origins,
@@ -46,10 +109,22 @@ CORSMiddleware,
     allow_methods=["*"],
     allow_headers=["*"]
 )
+app.add_middleware(logs.AccessLogMiddleware)
+
+@app.exception_handler(OperationalError)
+async def statement_timeout_handler(request: Request, exc: OperationalError):
+    # 57014 is query_canceled: the route's statement_timeout expired
+    if getattr(exc.orig, "pgcode", None) != "57014":
+        raise exc
+    watcher = request.scope.get(cancellation.SCOPE_KEY)
+    if watcher is not None and watcher.cancelled:
+        return Response(status_code=cancellation.CLIENT_CLOSED_REQUEST)
+    logger.warning("Query cancelled on %s %s: %s", request.method, request.url.path, exc.orig)
+    return JSONResponse(status_code=503, content={"detail": "Database query timed out"}, headers={"Retry-After": str(admission.ADMISSION_RETRY_AFTER_SECONDS)})
 
 @app.post("/token", response_model=schemas.Token)
 def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    logger.info(f"Received form_data: {form_data}")
+    logger.debug("Token requested for %s", form_data.username)
     user = auth.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
@@ -111,18 +186,18 @@ async def send_email(email: str, subject: str, message: str):
                 use_tls=True
             )
         else:
-            logger.error(f"Unsupported SMTP port: {smtp_port}")
+            logger.error("Unsupported SMTP port: %s", smtp_port)
             raise HTTPException(status_code=500, detail="Unsupported SMTP port")
 
-        logger.info(f"Email sent to {email} with subject '{subject}'")
+        logger.info("Email sent to %s with subject '%s'", email, subject)
     except aiosmtplib.SMTPConnectError as e:
-        logger.error(f"SMTPConnectError: {e}")
+        logger.error("SMTPConnectError: %s", e)
         raise HTTPException(status_code=500, detail="Failed to connect to SMTP server")
     except aiosmtplib.SMTPException as e:
-        logger.error(f"SMTPException: {e}")
+        logger.error("SMTPException: %s", e)
         raise HTTPException(status_code=500, detail="SMTP server returned an error response")
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
 
 @app.post("/send-email/")
@@ -132,50 +207,72 @@ async def send_email_endpoint(email: schemas.EmailSchema, db: AsyncSession = Dep
     return {"message": "Email has been sent", "email_id": db_email.id}
 
 @app.get("/surgeries", response_model=list[schemas.Surgery])
-async def read_surgeries(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_surgeries(db, skip=skip, limit=limit)
+async def read_surgeries(request: Request, skip: int = 0, limit: int = 100):
+    pin_primary = database.is_pinned_to_primary(request)
+    surgeries = await shared_reads.do(
+        ("/surgeries", skip, limit, pin_primary),
+        run_in_threadpool, load_catalog_json, "/surgeries", SURGERY_LIST, crud.get_surgeries, pin_primary, skip, limit
+    )
+    return Response(content=surgeries, media_type="application/json")
+
+@app.get("/surgeries/summary", response_model=list[schemas.SurgerySummary])
+def read_surgery_summaries(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_read_db)):
+    return crud.get_surgery_summaries(db, skip=skip, limit=limit)
 
 @app.get("/surgeries/{surgery_id}", response_model=schemas.SurgeryWithLogo)
-async def read_surgery(surgery_id: int, db: Session = Depends(get_db)):
-    surgery = crud.get_surgeries_by_id(db, surgery_id=surgery_id)
+async def read_surgery(surgery_id: int, request: Request):
+    pin_primary = database.is_pinned_to_primary(request)
+    surgery = await shared_reads.do(
+        ("/surgeries/{surgery_id}", surgery_id, pin_primary),
+        run_in_threadpool, load_catalog_json, "/surgeries/{surgery_id}", SURGERY_WITH_LOGO, crud.get_surgeries_by_id, pin_primary, surgery_id
+    )
     if not surgery:
         raise HTTPException(status_code=404, detail="Surgery not found")
-    return surgery
+    return Response(content=surgery, media_type="application/json")
 
 @app.delete("/surgeries/{surgery_id}", response_model=schemas.Surgery)
-async def delete_surgery(surgery_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def delete_surgery(surgery_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     surgery = crud.delete_surgery(db, surgery_id=surgery_id)
     if surgery is None:
         raise HTTPException(status_code=404, detail="Surgery not found")
+    catalog_changed(background_tasks)
     return surgery
 
 @app.put("/surgeries/{surgery_id}", response_model=schemas.Surgery)
-async def update_surgery(surgery_id: int, surgery_data: schemas.SurgeryUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def update_surgery(surgery_id: int, surgery_data: schemas.SurgeryUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     surgery = crud.update_surgery(db, surgery_id=surgery_id, surgery_data=surgery_data)
     if surgery is None:
         raise HTTPException(status_code=404, detail="Surgery not found")
+    catalog_changed(background_tasks)
     return surgery
 
 @app.patch("/surgeries/{surgery_id}", response_model=schemas.Surgery)
-async def partial_update_surgery(surgery_id: int, surgery_data: schemas.SurgeryPartialUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def partial_update_surgery(surgery_id: int, surgery_data: schemas.SurgeryPartialUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     surgery = crud.partial_update_surgery(db, surgery_id=surgery_id, surgery_data=surgery_data)
     if surgery is None:
         raise HTTPException(status_code=404, detail="Surgery not found")
+    catalog_changed(background_tasks)
     return surgery
 
 @app.post("/surgeries", response_model=schemas.Surgery)
-async def create_surgery(surgery: schemas.SurgeryCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def create_surgery(surgery: schemas.SurgeryCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     db_surgery = crud.create_surgery(db, surgery)
     if db_surgery is None:
         raise HTTPException(status_code=400, detail="Failed to create surgery")
+    catalog_changed(background_tasks)
     return db_surgery
 
 @app.get("/tier-lists", response_model=list[schemas.TierList])
-async def read_tier_lists(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_tier_lists(db, skip=skip, limit=limit)
+async def read_tier_lists(request: Request, skip: int = 0, limit: int = 100):
+    pin_primary = database.is_pinned_to_primary(request)
+    tier_lists = await shared_reads.do(
+        ("/tier-lists", skip, limit, pin_primary),
+        run_in_threadpool, load_catalog_json, "/tier-lists", TIER_LIST_LIST, crud.get_tier_lists, pin_primary, skip, limit
+    )
+    return Response(content=tier_lists, media_type="application/json")
 
 @app.get("/tier-lists/{tier_list_id}", response_model=schemas.TierList)
-async def read_tier_list(tier_list_id: int, db: Session = Depends(get_db)):
+async def read_tier_list(tier_list_id: int, db: Session = Depends(database.get_read_db)):
     tier_list = crud.get_tier_list_by_id(db, tier_list_id=tier_list_id)
     if tier_list is None:
         raise HTTPException(status_code=404, detail="Tier list not found")
@@ -185,44 +282,53 @@ async def read_tier_list(tier_list_id: int, db: Session = Depends(get_db)):
 async def update_tier_lists(
     tier_list_id: int,
     tier_list_data: schemas.TierListUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     tier_list = crud.update_tier_lists(db, tier_list_id=tier_list_id, tier_list_data=tier_list_data)
     if tier_list is None:
         raise HTTPException(status_code=404, detail="Tier list not found")
+    catalog_changed(background_tasks)
     return tier_list
 
 @app.get("/partners", response_model=list[schemas.Partner])
-async def read_partner_lists(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    print("Here")
-    return crud.get_partner_lists(db, skip=skip, limit=limit)
+async def read_partner_lists(request: Request, skip: int = 0, limit: int = 100):
+    pin_primary = database.is_pinned_to_primary(request)
+    partners = await shared_reads.do(
+        ("/partners", skip, limit, pin_primary),
+        run_in_threadpool, load_catalog_json, "/partners", PARTNER_LIST, crud.get_partner_lists, pin_primary, skip, limit
+    )
+    return Response(content=partners, media_type="application/json")
 
 @app.get("/partners/{partner_id}", response_model=schemas.Partner)
-async def read_partner_lists_Id(partner_id: int, db: Session = Depends(get_db)):
+async def read_partner_lists_Id(partner_id: int, db: Session = Depends(database.get_read_db)):
     partner = crud.get_partner_by_id(db, partner_id=partner_id)
     if partner is None:
         raise HTTPException(status_code=404, detail="Partner not found")
     return partner
 
 @app.delete("/partners/{partner_id}", response_model=schemas.Partner)
-async def delete_partner(partner_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def delete_partner(partner_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     partner = crud.delete_partner(db, partner_id=partner_id)
     if partner is None:
         raise HTTPException(status_code=404, detail="Partner not found")
+    catalog_changed(background_tasks)
     return partner
 
 
 @app.put("/partners/{partner_id}", response_model=schemas.Partner)
-async def update_partner(partner_id: int, partner_data: schemas.PartnerUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def update_partner(partner_id: int, partner_data: schemas.PartnerUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     partner = crud.update_partner(db, partner_id=partner_id, partner_data=partner_data)
     if partner is None:
         raise HTTPException(status_code=404, detail="Partner not found")
+    catalog_changed(background_tasks)
     return partner
 
 @app.post("/partners", response_model=schemas.Partner)
-async def create_partner(partner: schemas.PartnerCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def create_partner(partner: schemas.PartnerCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     db_partner = crud.create_partner(db=db, partner=partner)
+    catalog_changed(background_tasks)
     return {
         "id": db_partner.id,
         "company_name": db_partner.company_name,
@@ -234,32 +340,75 @@ async def create_partner(partner: schemas.PartnerCreate, db: Session = Depends(g
 @app.post("/upload/")
 async def upload_pdf_file(file: UploadFile = File(...), description: str = "", db: Session = Depends(get_db)):
     file_data = await file.read()
+    # Compress off the event loop; CompressedBinary stores storage.Encoded values as they are
+    file_data = await run_in_threadpool(storage.encode, file_data)
     pdf_file = crud.create_pdf_file(db=db, file_name=file.filename, file_data=file_data, description=description)
-    return {"file_id": pdf_file.id, "file_name": pdf_file.file_name}
+    pdf_pipeline.notify()
+    return {"file_id": pdf_file.id, "file_name": pdf_file.file_name, "job_id": pdf_file.jobs[0].id, "status": pdf_file.jobs[0].status}
 
 @app.get("/files/{file_id}")
 def get_file(file_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    file_record = db.query(models.PDFFile).filter(models.PDFFile.id == file_id).first()
+    file_record = crud.get_pdf_file_stored(db, file_id)
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
 
-    file_like = BytesIO(file_record.file_data)
-    return StreamingResponse(file_like, media_type="application/pdf", headers={"Content-Disposition": f"inline; filename={file_record.file_name}"})
+    file_name, stored_data = file_record
+    return StreamingResponse(storage.iter_decoded(stored_data), media_type="application/pdf", headers={"Content-Disposition": f"inline; filename={file_name}"})
+
+@app.get("/files/{file_id}/status", response_model=schemas.PDFFileStatus)
+def get_file_status(file_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    file_status = crud.get_pdf_file_status(db, file_id)
+    if not file_status:
+        raise HTTPException(status_code=404, detail="File not found")
+    return {
+        "file_id": file_status.id,
+        "file_name": file_status.file_name,
+        "job_id": file_status.job_id,
+        "status": file_status.status,
+        "attempts": file_status.attempts or 0,
+        "error": file_status.error,
+        "page_count": file_status.page_count,
+        "pdf_metadata": json.loads(file_status.pdf_metadata) if file_status.pdf_metadata else None,
+        "processed_at": file_status.processed_at
+    }
+
+@app.get("/files/{file_id}/thumbnail")
+def get_file_thumbnail(file_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    thumbnail = crud.get_pdf_thumbnail(db, file_id)
+    if not thumbnail:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    return Response(content=thumbnail, media_type="image/png")
 
 @app.post("/customers/", response_model=schemas.CustomerResponse)
 def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
     return crud.create_customer(db, customer)
 
+@app.post("/customers/import", response_model=schemas.CustomerImportReport)
+def import_customers(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # The import streams rows with COPY
+    if db.get_bind().dialect.name != "postgresql":
+        raise HTTPException(status_code=501, detail="Bulk customer import requires PostgreSQL")
+    rows = imports.iter_customers(file.file, file.filename, file.content_type)
+    try:
+        return crud.import_customers(db, rows)
+    except DBAPIError as e:
+        db.rollback()
+        logger.error("Customer import failed: %s", e.orig)
+        raise HTTPException(status_code=400, detail=f"Customer import failed: {e.orig}")
+
 @app.get("/customers/{customer_id}", response_model=schemas.CustomerResponse)
-def read_customer(customer_id: int, db: Session = Depends(get_db)):
+def read_customer(customer_id: int, db: Session = Depends(database.get_read_db)):
     db_customer = crud.get_customer(db, customer_id)
     if db_customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
     return db_customer
 
 @app.get("/customers/", response_model=list[schemas.CustomerResponse])
-def read_customers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_customers(db, skip=skip, limit=limit)
+def read_customers(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_read_db)):
+    customers = crud.get_customers(db, skip=skip, limit=limit)
+    with profiling.serializing():
+        content = CUSTOMER_LIST.dump_json(CUSTOMER_LIST.validate_python(customers))
+    return Response(content=content, media_type="application/json")
 
 @app.post("/buys/", response_model=schemas.BuyResponse)
 def create_buy(buy: schemas.BuyCreate, db: Session = Depends(get_db)):
@@ -273,5 +422,29 @@ def read_buy(buy_id: int, db: Session = Depends(get_db)):
     return db_buy
 
 @app.get("/customers/{customer_id}/buys/", response_model=list[schemas.BuyResponse])
-def read_buys_by_customer(customer_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_buys_by_customer(customer_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(database.get_read_db)):
     return crud.get_buys_by_customer(db, customer_id, skip=skip, limit=limit)
+
+def export_stream(stream_rows, columns, export_format: str):
+    # The stream outlives the request dependencies, so it owns its session; reports can lag behind on a replica
+    db = database.read_session()
+    try:
+        yield from export.iter_export(stream_rows(db), columns, export_format)
+    finally:
+        db.close()
+
+@app.get("/export/customers")
+def export_customers(export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"), current_user: models.User = Depends(get_current_user)):
+    return StreamingResponse(
+        export_stream(crud.stream_customers, crud.CUSTOMER_EXPORT_COLUMNS, export_format),
+        media_type=export.FORMATS[export_format],
+        headers={"Content-Disposition": f"attachment; filename=customers.{export_format}"}
+    )
+
+@app.get("/export/buys")
+def export_buys(export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"), current_user: models.User = Depends(get_current_user)):
+    return StreamingResponse(
+        export_stream(crud.stream_buys, crud.BUY_EXPORT_COLUMNS, export_format),
+        media_type=export.FORMATS[export_format],
+        headers={"Content-Disposition": f"attachment; filename=buys.{export_format}"}
+    )
@@ -70,9 +70,68 @@ CREATE TABLE customers (
 );
 
 
--- Table to store additional documents for each submission
+-- Creates the monthly range partitions <parent>_YYYY_MM for `months` months starting at first_month
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, first_month DATE, months INTEGER) RETURNS VOID AS $$
+DECLARE
+    month_start DATE;
+    month_end DATE;
+    partition_name TEXT;
+    default_partition TEXT;
+    key_column TEXT;
+BEGIN
+    SELECT d.relname, a.attname INTO default_partition, key_column
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    LEFT JOIN pg_class d ON d.oid = p.partdefid
+    WHERE p.partrelid = parent::regclass;
+
+    FOR i IN 0..months - 1 LOOP
+        month_start := (date_trunc('month', first_month) + make_interval(months => i))::date;
+        month_end := (month_start + interval '1 month')::date;
+        partition_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(quote_ident(partition_name)) IS NOT NULL THEN
+            CONTINUE;
+        END IF;
+        IF default_partition IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent, month_start, month_end
+            );
+        ELSE
+            -- Rows of the month that landed in the default partition while no partition covered it make
+            -- PARTITION OF fail, so they are moved to the new table before it is attached
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                default_partition, key_column, month_start, key_column, month_end, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                parent, partition_name, month_start, month_end
+            );
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Table for sent emails, partitioned by month
+CREATE TABLE IF NOT EXISTS emails (
+    id SERIAL,
+    mail_from VARCHAR,
+    mail_to VARCHAR,
+    subject VARCHAR,
+    message VARCHAR,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE INDEX IF NOT EXISTS ix_emails_mail_from ON emails (mail_from);
+CREATE INDEX IF NOT EXISTS ix_emails_mail_to ON emails (mail_to);
+CREATE TABLE IF NOT EXISTS emails_default PARTITION OF emails DEFAULT;
+SELECT create_monthly_partitions('emails', CURRENT_DATE, 4);
+
+-- Table to store additional documents for each submission, partitioned by month
 CREATE TABLE buys (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     customer_id INTEGER NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
     surgery_id INTEGER NOT NULL REFERENCES surgeries(id) ON DELETE CASCADE,
     tier_list_id INTEGER NOT NULL REFERENCES tier_lists(id) ON DELETE CASCADE,
@@ -91,9 +150,35 @@ CREATE TABLE buys (
     medical_travel_insurance BYTEA, -- Medical travel insurance
     proof_of_financial_means BYTEA, -- Proof of financial means
     guarantee_letter BYTEA, -- Digitally written guarantee letter
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    documents_archived BOOLEAN NOT NULL DEFAULT FALSE, -- Document bytes moved to buy_documents_archive
+    PRIMARY KEY (id, created_at),
     FOREIGN KEY (customer_id) REFERENCES customers(id),
     FOREIGN KEY (surgery_id) REFERENCES surgeries(id),
     FOREIGN KEY (tier_list_id) REFERENCES tier_lists(id)
+) PARTITION BY RANGE (created_at);
+CREATE INDEX IF NOT EXISTS ix_buys_id ON buys (id);
+CREATE INDEX IF NOT EXISTS ix_buys_customer_id ON buys (customer_id);
+CREATE TABLE IF NOT EXISTS buys_default PARTITION OF buys DEFAULT;
+SELECT create_monthly_partitions('buys', CURRENT_DATE, 4);
+
+-- Cold storage for the documents of old buys
+CREATE TABLE IF NOT EXISTS buy_documents_archive (
+    buy_id INTEGER PRIMARY KEY,
+    valid_photo BYTEA,
+    id_scan BYTEA,
+    medical_dossier BYTEA,
+    trip_clearance_doc BYTEA,
+    oral_care_implant_plan BYTEA,
+    hair_care_implant_plan BYTEA,
+    visa_documents BYTEA,
+    visa_application_form BYTEA,
+    identical_photos BYTEA,
+    passport_copy BYTEA,
+    medical_travel_insurance BYTEA,
+    proof_of_financial_means BYTEA,
+    guarantee_letter BYTEA,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
 
@@ -106,9 +191,44 @@ CREATE TABLE IF NOT EXISTS pdf_files (
     file_name VARCHAR(255) NOT NULL,
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     file_data bytea NOT NULL,
-    description VARCHAR(255)
+    description VARCHAR(255),
+    page_count INTEGER, -- Filled in by the PDF post-processing pipeline
+    pdf_metadata TEXT,
+    text_content TEXT,
+    thumbnail bytea, -- PNG of the first page
+    processed_at TIMESTAMP
 );
 
+-- Queue of PDF post-processing jobs
+CREATE TABLE IF NOT EXISTS pdf_jobs (
+    id serial PRIMARY KEY,
+    pdf_file_id INTEGER NOT NULL REFERENCES pdf_files(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_pdf_jobs_pdf_file_id ON pdf_jobs (pdf_file_id);
+CREATE INDEX IF NOT EXISTS ix_pdf_jobs_status ON pdf_jobs (status);
+
+-- Stored responses for requests sent with an Idempotency-Key header
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(255) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    path VARCHAR(255) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    owner VARCHAR(32),
+    response_status INTEGER,
+    response_headers TEXT,
+    response_body bytea,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (key, method, path)
+);
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at ON idempotency_keys (expires_at);
+
 
 INSERT INTO partners (company_name, website, small_description, large_description, help_type, logo)
 VALUES (
@@ -164,3 +284,34 @@ CREATE EXTENSION IF NOT EXISTS pgcrypto;
 -- Insert a user with a hashed password using bcrypt
 INSERT INTO users (username, hashed_password)
 VALUES ('luispedro188', crypt('sardinha189', gen_salt('bf')));
+
+-- Surgery listing summary: one row per surgery with its partner name and tier price range.
+-- Refreshed concurrently by the backend whenever surgeries, tier lists or partners change.
+
+-- Prices are free text such as "12000€", "1.500 €" or "1,500.50 EUR". "." and "," are thousands separators,
+-- except when followed by one or two final digits, which are the decimals: 1.500€ is 1500, 1.500,50€ is 1500.50.
+CREATE OR REPLACE FUNCTION parse_price(price TEXT) RETURNS NUMERIC AS $$
+    SELECT CASE WHEN cleaned ~ '^[0-9]+([.,][0-9]+)*$' THEN (
+        regexp_replace(regexp_replace(cleaned, '[.,][0-9]{1,2}$', ''), '[.,]', '', 'g')
+        || COALESCE('.' || substring(cleaned from '[.,]([0-9]{1,2})$'), '')
+    )::numeric END
+    FROM (SELECT rtrim(regexp_replace(price, '[^0-9.,]', '', 'g'), '.,') AS cleaned) AS p
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS surgery_summary AS
+SELECT
+    s.id,
+    s.surgery,
+    s.surgery_description,
+    s.partner_id,
+    p.company_name AS partner_name,
+    MIN(parse_price(t.price)) AS min_price,
+    MAX(parse_price(t.price)) AS max_price,
+    COUNT(t.id) AS tier_count
+FROM surgeries s
+JOIN partners p ON p.id = s.partner_id
+LEFT JOIN tier_lists t ON t.surgery_id = s.id
+GROUP BY s.id, p.company_name;
+
+-- Required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS surgery_summary_id ON surgery_summary (id);
@@ -0,0 +1,25 @@
+-- Surgery listing summary: one row per surgery with its partner name and tier price range.
+-- Refreshed concurrently by the backend whenever surgeries, tier lists or partners change.
+
+CREATE OR REPLACE FUNCTION parse_price(price TEXT) RETURNS NUMERIC AS $$
+    SELECT CASE WHEN cleaned ~ '^[0-9]+(\.[0-9]+)?$' THEN cleaned::numeric END
+    FROM (SELECT regexp_replace(price, '[^0-9.]', '', 'g') AS cleaned) AS p
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS surgery_summary AS
+SELECT
+    s.id,
+    s.surgery,
+    s.surgery_description,
+    s.partner_id,
+    p.company_name AS partner_name,
+    MIN(parse_price(t.price)) AS min_price,
+    MAX(parse_price(t.price)) AS max_price,
+    COUNT(t.id) AS tier_count
+FROM surgeries s
+JOIN partners p ON p.id = s.partner_id
+LEFT JOIN tier_lists t ON t.surgery_id = s.id
+GROUP BY s.id, p.company_name;
+
+-- Required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS surgery_summary_id ON surgery_summary (id);
@@ -0,0 +1,20 @@
+-- PDF post-processing: extracted metadata on pdf_files and the persistent job queue.
+
+ALTER TABLE pdf_files ADD COLUMN IF NOT EXISTS page_count INTEGER;
+ALTER TABLE pdf_files ADD COLUMN IF NOT EXISTS pdf_metadata TEXT;
+ALTER TABLE pdf_files ADD COLUMN IF NOT EXISTS text_content TEXT;
+ALTER TABLE pdf_files ADD COLUMN IF NOT EXISTS thumbnail bytea;
+ALTER TABLE pdf_files ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS pdf_jobs (
+    id serial PRIMARY KEY,
+    pdf_file_id INTEGER NOT NULL REFERENCES pdf_files(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_pdf_jobs_pdf_file_id ON pdf_jobs (pdf_file_id);
+CREATE INDEX IF NOT EXISTS ix_pdf_jobs_status ON pdf_jobs (status);
@@ -0,0 +1,102 @@
+-- Adds created_at to emails and buys, converts both tables to monthly range partitions
+-- and creates the buy_documents_archive cold table. Existing rows get the migration time
+-- as created_at, since their real creation time was never recorded.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, first_month DATE, months INTEGER) RETURNS VOID AS $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR i IN 0..months - 1 LOOP
+        month_start := (date_trunc('month', first_month) + make_interval(months => i))::date;
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            parent || '_' || to_char(month_start, 'YYYY_MM'), parent, month_start, (month_start + interval '1 month')::date
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- emails
+ALTER TABLE emails RENAME TO emails_unpartitioned;
+CREATE TABLE emails (
+    id INTEGER NOT NULL DEFAULT nextval('emails_id_seq'),
+    mail_from VARCHAR,
+    mail_to VARCHAR,
+    subject VARCHAR,
+    message VARCHAR,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE emails_default PARTITION OF emails DEFAULT;
+SELECT create_monthly_partitions('emails', CURRENT_DATE, 4);
+INSERT INTO emails (id, mail_from, mail_to, subject, message)
+SELECT id, mail_from, mail_to, subject, message FROM emails_unpartitioned;
+ALTER SEQUENCE emails_id_seq OWNED BY emails.id;
+DROP TABLE emails_unpartitioned;
+CREATE INDEX ix_emails_mail_from ON emails (mail_from);
+CREATE INDEX ix_emails_mail_to ON emails (mail_to);
+
+-- buys
+ALTER TABLE buys RENAME TO buys_unpartitioned;
+CREATE TABLE buys (
+    id INTEGER NOT NULL DEFAULT nextval('buys_id_seq'),
+    customer_id INTEGER NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+    surgery_id INTEGER NOT NULL REFERENCES surgeries(id) ON DELETE CASCADE,
+    tier_list_id INTEGER NOT NULL REFERENCES tier_lists(id) ON DELETE CASCADE,
+    price VARCHAR(255),
+    valid_photo BYTEA,
+    id_scan BYTEA,
+    medical_dossier BYTEA,
+    trip_clearance_doc BYTEA,
+    schengen_area BOOLEAN NOT NULL,
+    oral_care_implant_plan BYTEA,
+    hair_care_implant_plan BYTEA,
+    visa_documents BYTEA,
+    visa_application_form BYTEA,
+    identical_photos BYTEA,
+    passport_copy BYTEA,
+    medical_travel_insurance BYTEA,
+    proof_of_financial_means BYTEA,
+    guarantee_letter BYTEA,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    documents_archived BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE buys_default PARTITION OF buys DEFAULT;
+SELECT create_monthly_partitions('buys', CURRENT_DATE, 4);
+INSERT INTO buys (
+    id, customer_id, surgery_id, tier_list_id, price, valid_photo, id_scan, medical_dossier, trip_clearance_doc,
+    schengen_area, oral_care_implant_plan, hair_care_implant_plan, visa_documents, visa_application_form,
+    identical_photos, passport_copy, medical_travel_insurance, proof_of_financial_means, guarantee_letter
+)
+SELECT
+    id, customer_id, surgery_id, tier_list_id, price, valid_photo, id_scan, medical_dossier, trip_clearance_doc,
+    schengen_area, oral_care_implant_plan, hair_care_implant_plan, visa_documents, visa_application_form,
+    identical_photos, passport_copy, medical_travel_insurance, proof_of_financial_means, guarantee_letter
+FROM buys_unpartitioned;
+ALTER SEQUENCE buys_id_seq OWNED BY buys.id;
+DROP TABLE buys_unpartitioned;
+CREATE INDEX ix_buys_id ON buys (id);
+CREATE INDEX ix_buys_customer_id ON buys (customer_id);
+
+CREATE TABLE IF NOT EXISTS buy_documents_archive (
+    buy_id INTEGER PRIMARY KEY,
+    valid_photo BYTEA,
+    id_scan BYTEA,
+    medical_dossier BYTEA,
+    trip_clearance_doc BYTEA,
+    oral_care_implant_plan BYTEA,
+    hair_care_implant_plan BYTEA,
+    visa_documents BYTEA,
+    visa_application_form BYTEA,
+    identical_photos BYTEA,
+    passport_copy BYTEA,
+    medical_travel_insurance BYTEA,
+    proof_of_financial_means BYTEA,
+    guarantee_letter BYTEA,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMIT;
@@ -0,0 +1,4 @@
+-- Idempotency keys: in_progress rows hold a renewable lease owned by the running request,
+-- so the key can be taken over when that request's worker dies.
+
+ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS owner VARCHAR(32);
@@ -0,0 +1,13 @@
+-- parse_price read "1.500€" as 1.5: treat "." and "," as thousands separators unless they start the decimals.
+
+-- Prices are free text such as "12000€", "1.500 €" or "1,500.50 EUR". "." and "," are thousands separators,
+-- except when followed by one or two final digits, which are the decimals: 1.500€ is 1500, 1.500,50€ is 1500.50.
+CREATE OR REPLACE FUNCTION parse_price(price TEXT) RETURNS NUMERIC AS $$
+    SELECT CASE WHEN cleaned ~ '^[0-9]+([.,][0-9]+)*$' THEN (
+        regexp_replace(regexp_replace(cleaned, '[.,][0-9]{1,2}$', ''), '[.,]', '', 'g')
+        || COALESCE('.' || substring(cleaned from '[.,]([0-9]{1,2})$'), '')
+    )::numeric END
+    FROM (SELECT rtrim(regexp_replace(price, '[^0-9.,]', '', 'g'), '.,') AS cleaned) AS p
+$$ LANGUAGE SQL IMMUTABLE;
+
+REFRESH MATERIALIZED VIEW surgery_summary;
@@ -0,0 +1,45 @@
+-- create_monthly_partitions failed once rows of a month had landed in the DEFAULT partition (e.g. after the
+-- archival job lapsed): it now moves those rows into the new monthly partition before attaching it.
+
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, first_month DATE, months INTEGER) RETURNS VOID AS $$
+DECLARE
+    month_start DATE;
+    month_end DATE;
+    partition_name TEXT;
+    default_partition TEXT;
+    key_column TEXT;
+BEGIN
+    SELECT d.relname, a.attname INTO default_partition, key_column
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    LEFT JOIN pg_class d ON d.oid = p.partdefid
+    WHERE p.partrelid = parent::regclass;
+
+    FOR i IN 0..months - 1 LOOP
+        month_start := (date_trunc('month', first_month) + make_interval(months => i))::date;
+        month_end := (month_start + interval '1 month')::date;
+        partition_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(quote_ident(partition_name)) IS NOT NULL THEN
+            CONTINUE;
+        END IF;
+        IF default_partition IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent, month_start, month_end
+            );
+        ELSE
+            -- Rows of the month that landed in the default partition while no partition covered it make
+            -- PARTITION OF fail, so they are moved to the new table before it is attached
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                default_partition, key_column, month_start, key_column, month_end, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                parent, partition_name, month_start, month_end
+            );
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
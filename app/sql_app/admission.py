@@ -0,0 +1,86 @@
+import collections, json, os, threading, time
+from .logs import SAMPLED_ERROR_SCOPE_KEY
+
+# 0 disables the corresponding check
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 200))
+ADMISSION_MAX_POOL_WAIT_MS = float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", 500))
+# Pool waits are averaged over this window; once shedding starts, it reopens when the slow samples age out
+ADMISSION_WINDOW_SECONDS = float(os.getenv("ADMISSION_WINDOW_SECONDS", 5))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 1))
+
+OVERLOADED_BODY = json.dumps({"detail": "Server is overloaded, retry later"}).encode()
+
+
+class PoolWaitWindow:
+    """Time requests spent waiting for a pooled database connection over the last `window` seconds."""
+
+    def __init__(self, window: float = ADMISSION_WINDOW_SECONDS):
+        self.window = window
+        self._samples = collections.deque()
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, seconds))
+            self._prune(now)
+
+    def average_ms(self) -> float:
+        with self._lock:
+            self._prune(time.monotonic())
+            if not self._samples:
+                return 0.0
+            return sum(seconds for _, seconds in self._samples) / len(self._samples) * 1000
+
+    def _prune(self, now: float):
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+
+
+pool_waits = PoolWaitWindow()
+
+
+class AdmissionMiddleware:
+    """Answers 503 with Retry-After straight away while the worker is saturated, instead of queueing more work.
+
+    The worker counts as saturated when it is already running `max_in_flight` requests, or when requests
+    recently waited more than `max_pool_wait_ms` on average for a database connection.
+    """
+
+    def __init__(self, app, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, max_pool_wait_ms: float = ADMISSION_MAX_POOL_WAIT_MS,
+                 retry_after: int = ADMISSION_RETRY_AFTER_SECONDS, waits: PoolWaitWindow = pool_waits):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.max_pool_wait_ms = max_pool_wait_ms
+        self.retry_after = retry_after
+        self.waits = waits
+        self.in_flight = 0
+
+    def overloaded(self) -> bool:
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return True
+        return bool(self.max_pool_wait_ms) and self.waits.average_ms() > self.max_pool_wait_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if self.overloaded():
+            # A flood of 503s is the expected outcome of shedding; one access log line each would add to the load
+            scope[SAMPLED_ERROR_SCOPE_KEY] = True
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(OVERLOADED_BODY)).encode()),
+                    (b"retry-after", str(self.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": OVERLOADED_BODY})
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,113 @@
+"""Partition maintenance and archival for the emails and buys tables.
+
+Run periodically (e.g. daily from cron) with `python -m sql_app.archival`:
+
+- creates the monthly partitions for the coming PARTITION_MONTHS_AHEAD months, moving in any rows of those
+  months that landed in the DEFAULT partition while the job wasn't running,
+- moves the document bytes of buys older than ARCHIVE_DOCUMENTS_AFTER_DAYS to buy_documents_archive,
+- detaches email partitions older than EMAIL_RETENTION_MONTHS, leaving them as standalone tables to dump and drop.
+
+A failing step is logged and the others still run; the exit status is 1 if any step failed.
+"""
+import logging, os, re, sys
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import BUY_DOCUMENT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("emails", "buys")
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+ARCHIVE_DOCUMENTS_AFTER_DAYS = int(os.getenv("ARCHIVE_DOCUMENTS_AFTER_DAYS", 180))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+# 0 keeps every email partition attached
+EMAIL_RETENTION_MONTHS = int(os.getenv("EMAIL_RETENTION_MONTHS", 24))
+
+_PARTITION_NAME = re.compile(r"_(\d{4})_(\d{2})$")
+
+ARCHIVE_BUY_DOCUMENTS = f"""
+    WITH moved AS (
+        SELECT id, created_at FROM buys
+        WHERE NOT documents_archived AND created_at < :cutoff
+        ORDER BY created_at
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ), archived AS (
+        INSERT INTO buy_documents_archive (buy_id, {", ".join(BUY_DOCUMENT_COLUMNS)})
+        SELECT b.id, {", ".join("b." + column for column in BUY_DOCUMENT_COLUMNS)}
+        FROM buys b JOIN moved USING (id, created_at)
+        RETURNING buy_id
+    )
+    UPDATE buys b
+    SET documents_archived = TRUE, {", ".join(column + " = NULL" for column in BUY_DOCUMENT_COLUMNS)}
+    FROM moved
+    WHERE b.id = moved.id AND b.created_at = moved.created_at AND b.id IN (SELECT buy_id FROM archived)
+"""
+
+
+def _month_start(day: date, months_back: int = 0) -> date:
+    month_index = day.year * 12 + day.month - 1 - months_back
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def ensure_partitions(db: Session, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    today = datetime.now(timezone.utc).date()
+    for table in PARTITIONED_TABLES:
+        db.execute(
+            text("SELECT create_monthly_partitions(:parent, :first_month, :months)"),
+            {"parent": table, "first_month": _month_start(today), "months": months_ahead + 1}
+        )
+    db.commit()
+
+
+def archive_buy_documents(db: Session, older_than_days: int = ARCHIVE_DOCUMENTS_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        moved = db.execute(text(ARCHIVE_BUY_DOCUMENTS), {"cutoff": cutoff, "batch_size": batch_size}).rowcount
+        db.commit()
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+def detach_old_partitions(db: Session, table: str = "emails", retention_months: int = EMAIL_RETENTION_MONTHS) -> list[str]:
+    if retention_months <= 0:
+        return []
+    cutoff = _month_start(datetime.now(timezone.utc).date(), retention_months)
+    partitions = db.execute(
+        text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = CAST(:parent AS regclass)"),
+        {"parent": table}
+    ).scalars().all()
+
+    detached = []
+    for partition in sorted(partitions):
+        match = _PARTITION_NAME.search(partition)
+        # The partition holds one month, so it is only old enough once that whole month is before the cutoff
+        if match and date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{partition}"'))
+            detached.append(partition)
+    db.commit()
+    return detached
+
+
+def run() -> bool:
+    """Runs every step in its own session, so one failing step doesn't hold back the others. False if any failed."""
+    ok = True
+    for step in (ensure_partitions, archive_buy_documents, detach_old_partitions):
+        db = SessionLocal()
+        try:
+            logger.info("Archival step %s done: %s", step.__name__, step(db))
+        except Exception:
+            ok = False
+            logger.exception("Archival step %s failed", step.__name__)
+        finally:
+            db.close()
+    return ok
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if run() else 1)
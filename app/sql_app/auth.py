@@ -1,5 +1,6 @@
-import os
-from datetime import datetime, timedelta
+import hashlib, json, os, threading, time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
@@ -8,11 +9,17 @@ from fastapi.security import OAuth2PasswordBearer
 from .models import User
 from .schemas import TokenData
 from .database import get_db
+from . import cache
 
 # Environment Variables
 SECRET_KEY = os.getenv("SECRET_KEY", "nugomed_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 1024))
+
+# Verified claims keyed by the token's SHA-256 digest, kept until the token's exp
+_token_cache: OrderedDict[bytes, dict] = OrderedDict()
+_token_cache_lock = threading.Lock()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -29,16 +36,46 @@ def authenticate_user(db: Session, username: str, password: str) -> User | bool:
         return False
     return user
 
+def _load_user_json(db: Session, username: str) -> bytes | None:
+    user = db.query(User.id, User.username).filter(User.username == username).first()
+    return json.dumps({"id": user.id, "username": user.username}).encode() if user else None
+
+def get_user_by_username(db: Session, username: str) -> User | None:
+    # Only the id and username are cached, the returned User is not attached to the session
+    if not cache.enabled():
+        return db.query(User).filter(User.username == username).first()
+    cached = cache.get_or_set(cache.USERS, (username,), lambda: _load_user_json(db, username))
+    return User(**json.loads(cached)) if cached else None
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.now() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.now() + timedelta(minutes=15)
+        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+        if payload is not None:
+            if payload["exp"] > time.time():
+                _token_cache.move_to_end(key)
+                return payload
+            del _token_cache[key]
+
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    # Tokens without an exp would never leave the cache, so only expiring ones are kept
+    if TOKEN_CACHE_SIZE > 0 and isinstance(payload.get("exp"), (int, float)):
+        with _token_cache_lock:
+            _token_cache[key] = payload
+            while len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return payload
+
 def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,14 +83,14 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.username == token_data.username).first()
+    user = get_user_by_username(db, token_data.username)
     if user is None:
         raise credentials_exception
     return user
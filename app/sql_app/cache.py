@@ -0,0 +1,146 @@
+import abc, logging, os, threading, time
+from typing import Callable
+
+try:
+    import redis
+except ImportError:  # only needed for redis:// cache URLs
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# none (the default), memory:// for a per-process cache, or redis://host:6379/0 to share entries between replicas
+CACHE_URL = os.getenv("CACHE_URL", "none")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 300))
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "nugomed")
+
+CATALOG = "catalog"
+USERS = "users"
+
+
+class CacheBackend(abc.ABC):
+    @abc.abstractmethod
+    def get(self, key: str) -> bytes | None:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, value: bytes, ttl: int | None = None):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    def incr(self, key: str) -> int:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self):
+        self._entries: dict[str, tuple[bytes, float | None]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires = self._entries.get(key, (b"0", None))
+            value = str(int(value) + 1).encode()
+            self._entries[key] = (value, expires)
+            return int(value)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Any server speaking the Redis protocol (Redis, Valkey, KeyDB, ...)."""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("CACHE_URL=redis://... requires the 'redis' package")
+        self._client = redis.Redis.from_url(url, protocol=2, socket_timeout=1, socket_connect_timeout=1)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, value, ex=ttl)
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+
+def create_backend(url: str) -> CacheBackend | None:
+    if not url or url == "none":
+        return None
+    if url.startswith("memory://"):
+        return MemoryCacheBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+backend = create_backend(CACHE_URL)
+
+
+def enabled() -> bool:
+    return backend is not None
+
+
+def _version_key(namespace: str) -> str:
+    return f"{CACHE_KEY_PREFIX}:{namespace}:version"
+
+
+def entry_key(namespace: str, parts: tuple) -> str:
+    # Entries embed their namespace's version, so bumping it orphans them on every replica at once
+    version = backend.get(_version_key(namespace)) or b"0"
+    return f"{CACHE_KEY_PREFIX}:{namespace}:v{version.decode()}:{':'.join(str(part) for part in parts)}"
+
+
+def get_or_set(namespace: str, parts: tuple, load: Callable[[], bytes | None], ttl: int = CACHE_TTL_SECONDS) -> bytes | None:
+    """Returns the cached bytes for the key, or stores what `load` returns. None results are not cached."""
+    if backend is None:
+        return load()
+    try:
+        key = entry_key(namespace, parts)
+        value = backend.get(key)
+        if value is not None:
+            return value
+    except Exception as e:
+        logger.warning("Cache read failed, loading from the database: %s", e)
+        return load()
+
+    value = load()
+    if value is not None:
+        try:
+            backend.set(key, value, ttl)
+        except Exception as e:
+            logger.warning("Cache write failed: %s", e)
+    return value
+
+
+def invalidate(namespace: str):
+    if backend is None:
+        return
+    try:
+        backend.incr(_version_key(namespace))
+    except Exception as e:
+        logger.error("Failed to invalidate cache namespace %s: %s", namespace, e)
@@ -0,0 +1,106 @@
+import asyncio, logging, threading
+
+logger = logging.getLogger(__name__)
+
+# Writes run to completion even if the client goes away, so a retry with the same Idempotency-Key sees the outcome
+CANCELLABLE_METHODS = {"GET", "HEAD"}
+SCOPE_KEY = "disconnect_watcher"
+CLIENT_CLOSED_REQUEST = 499
+
+
+class DisconnectWatcher:
+    """DBAPI connections a request currently holds, so their running queries can be cancelled from another thread."""
+
+    def __init__(self):
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._finished = False
+        self.cancelled = False
+
+    def track(self, dbapi_connection):
+        with self._lock:
+            self._connections.add(dbapi_connection)
+
+    def untrack(self, dbapi_connection):
+        # Taking the lock means a connection is never cancelled after it went back to the pool
+        with self._lock:
+            self._connections.discard(dbapi_connection)
+
+    def finish(self):
+        with self._lock:
+            self._finished = True
+
+    def cancel(self):
+        with self._lock:
+            if self._finished:
+                return
+            self.cancelled = True
+            for dbapi_connection in self._connections:
+                # psycopg2 and psycopg cancel the running statement, sqlite3 interrupts it
+                cancel = getattr(dbapi_connection, "cancel", None) or getattr(dbapi_connection, "interrupt", None)
+                if cancel is None:
+                    continue
+                try:
+                    cancel()
+                except Exception as e:
+                    logger.warning("Failed to cancel query after client disconnect: %s", e)
+
+
+class CancelOnDisconnectMiddleware:
+    """Cancels the database queries of a read request as soon as its client disconnects.
+
+    The request messages are read eagerly by a listener task, which is the only way to notice a
+    disconnect while a `def` endpoint is blocked on the database. The cancelled request is logged as 499.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in CANCELLABLE_METHODS:
+            return await self.app(scope, receive, send)
+
+        watcher = DisconnectWatcher()
+        scope[SCOPE_KEY] = watcher
+        messages = asyncio.Queue()
+        response_started = False
+
+        async def listen():
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    # Not the request threadpool: under load it is exactly what the stuck queries are holding
+                    await asyncio.get_running_loop().run_in_executor(None, watcher.cancel)
+                    return
+
+        async def queued_receive():
+            message = await messages.get()
+            if message["type"] == "http.disconnect":
+                # Every later receive sees the disconnect as well
+                messages.put_nowait(message)
+            return message
+
+        async def watched_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                if watcher.cancelled:
+                    message = {**message, "status": CLIENT_CLOSED_REQUEST}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                watcher.finish()
+            await send(message)
+
+        listener = asyncio.create_task(listen())
+        try:
+            await self.app(scope, queued_receive, watched_send)
+        except Exception:
+            if not watcher.cancelled:
+                raise
+            logger.info("Cancelled %s %s after the client disconnected", scope["method"], scope["path"])
+            if not response_started:
+                await send({"type": "http.response.start", "status": CLIENT_CLOSED_REQUEST, "headers": []})
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.finish()
+            listener.cancel()
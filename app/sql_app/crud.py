@@ -1,8 +1,13 @@
+from sqlalchemy import LargeBinary, type_coerce, select, text
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from passlib.context import CryptContext
-from .models import Email, Surgery, TierList, Partner, PDFFile, User, Buy, Customer
+from .database import SessionLocal
+from .models import Email, Surgery, TierList, Partner, PDFFile, PDFJob, User, Buy, BuyDocumentArchive, Customer, BUY_DOCUMENT_COLUMNS
 from .schemas import EmailSchema, SurgeryCreate, SurgeryUpdate, SurgeryPartialUpdate, UserCreate, TierListUpdate, PartnerUpdate, PartnerCreate, CustomerCreate, BuyCreate, SurgeryWithLogo
-import base64
+import base64, io, logging, threading
+
+logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -51,8 +56,30 @@ def get_surgeries_by_id(db: Session, surgery_id: int):
         )
     return None
 
+# List endpoints select only the response columns and build plain dicts from the row tuples,
+# skipping ORM hydration and the identity map
+SURGERY_COLUMNS = [Surgery.id, Surgery.surgery, Surgery.surgery_description, Surgery.partner_id]
+TIER_LIST_COLUMNS = [
+    TierList.id, TierList.tier, TierList.surgery_id, TierList.visa_sponsorship, TierList.flight_type,
+    TierList.number_family_members, TierList.hospital_accommodations, TierList.hotel, TierList.duration_stay,
+    TierList.tourism_package, TierList.post_surgery_monitoring, TierList.price
+]
+PARTNER_COLUMNS = [
+    Partner.id, Partner.company_name, Partner.website, Partner.help_type,
+    Partner.small_description, Partner.large_description, Partner.logo
+]
+CUSTOMER_COLUMNS = [
+    Customer.id, Customer.full_name, Customer.contact_email, Customer.birthdate, Customer.national_id_number,
+    Customer.passport_number, Customer.tin_number, Customer.country_of_origin, Customer.denied_visa
+]
+
+def _select_page(db: Session, columns, skip: int, limit: int) -> list[dict]:
+    result = db.execute(select(*columns).order_by(columns[0]).offset(skip).limit(limit))
+    keys = tuple(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
 def get_surgeries(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Surgery).order_by(Surgery.id).offset(skip).limit(limit).all()
+    return _select_page(db, SURGERY_COLUMNS, skip, limit)
 
 def delete_surgery(db: Session, surgery_id: int):
     surgery = db.query(Surgery).filter(Surgery.id == surgery_id).first()
@@ -99,15 +126,38 @@ def create_surgery(db: Session, surgery: SurgeryCreate):
     db.refresh(db_surgery)
     return db_surgery
 
+def get_surgery_summaries(db: Session, skip: int = 0, limit: int = 100):
+    return db.execute(
+        text("SELECT * FROM surgery_summary ORDER BY id OFFSET :skip LIMIT :limit"),
+        {"skip": skip, "limit": limit}
+    ).mappings().all()
+
+_summary_refresh_lock = threading.Lock()
+_summary_refresh_pending = threading.Event()
+
+def refresh_surgery_summary():
+    # Writes that land while a refresh is running are folded into one more refresh instead of queueing up
+    _summary_refresh_pending.set()
+    while _summary_refresh_pending.is_set() and _summary_refresh_lock.acquire(blocking=False):
+        try:
+            _summary_refresh_pending.clear()
+            db = SessionLocal()
+            try:
+                if db.get_bind().dialect.name == "postgresql":
+                    db.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY surgery_summary"))
+                    db.commit()
+            except Exception as e:
+                logger.error("Failed to refresh surgery_summary: %s", e)
+            finally:
+                db.close()
+        finally:
+            _summary_refresh_lock.release()
+
 def get_tier_list_by_id(db: Session, tier_list_id: int):
     return db.query(TierList).filter(TierList.id == tier_list_id).first()
 
 def get_tier_lists(db: Session, skip: int = 0, limit: int = 100):
-    try:
-        tier_lists = db.query(TierList).offset(skip).limit(limit).all()
-        return tier_lists
-    except Exception as e:
-        raise e
+    return _select_page(db, TIER_LIST_COLUMNS, skip, limit)
 
 def update_tier_lists(db: Session, tier_list_id: int, tier_list_data: TierListUpdate):
     tier_list = db.query(TierList).filter(TierList.id == tier_list_id).first()
@@ -126,25 +176,10 @@ def update_tier_lists(db: Session, tier_list_id: int, tier_list_data: TierListUp
     return tier_list
 
 def get_partner_lists(db: Session, skip: int = 0, limit: int = 100):
-    try:
-        partners = db.query(Partner).offset(skip).limit(limit).all()
-        partners_list = []
-        for partner in partners:
-            logo_base64 = base64.b64encode(partner.logo).decode('utf-8') if partner.logo else None
-            partners_list.append({
-                "id": partner.id,
-                "company_name": partner.company_name,
-                "website": partner.website,
-                "help_type": partner.help_type,
-                "small_description": partner.small_description,
-                "large_description": partner.large_description,
-                "logo": logo_base64
-            })
-
-        return partners_list
-
-    except Exception as e:
-        raise e
+    partners = _select_page(db, PARTNER_COLUMNS, skip, limit)
+    for partner in partners:
+        partner["logo"] = base64.b64encode(partner["logo"]).decode('utf-8') if partner["logo"] else None
+    return partners
 
 def get_partner_by_id(db: Session, partner_id: int):
     try:
@@ -219,6 +254,8 @@ def create_partner(db: Session, partner: PartnerCreate):
 
 def create_pdf_file(db: Session, file_name: str, file_data: bytes, description: str):
     db_pdf_file = PDFFile(file_name=file_name, file_data=file_data, description=description)
+    # Queued in the same transaction, so every stored file gets post-processed
+    db_pdf_file.jobs.append(PDFJob(status="pending", attempts=0))
     db.add(db_pdf_file)
     db.commit()
     db.refresh(db_pdf_file)
@@ -227,6 +264,29 @@ def create_pdf_file(db: Session, file_name: str, file_data: bytes, description:
 def get_pdf_file(db: Session, file_id: int):
     return db.query(PDFFile).filter(PDFFile.id == file_id).first()
 
+def get_pdf_file_stored(db: Session, file_id: int):
+    # Returns (file_name, stored bytes) without decoding, so callers can stream with storage.iter_decoded
+    return (
+        db.query(PDFFile.file_name, type_coerce(PDFFile.file_data, LargeBinary))
+        .filter(PDFFile.id == file_id)
+        .first()
+    )
+
+def get_pdf_file_status(db: Session, file_id: int):
+    return (
+        db.query(
+            PDFFile.id, PDFFile.file_name, PDFFile.page_count, PDFFile.pdf_metadata, PDFFile.processed_at,
+            PDFJob.id.label("job_id"), PDFJob.status, PDFJob.attempts, PDFJob.error
+        )
+        .outerjoin(PDFJob, PDFJob.pdf_file_id == PDFFile.id)
+        .filter(PDFFile.id == file_id)
+        .order_by(PDFJob.id.desc())
+        .first()
+    )
+
+def get_pdf_thumbnail(db: Session, file_id: int):
+    return db.query(PDFFile.thumbnail).filter(PDFFile.id == file_id).scalar()
+
 def get_pdf_files(db: Session, skip: int = 0, limit: int = 10):
     return db.query(PDFFile).offset(skip).limit(limit).all()
 
@@ -253,11 +313,87 @@ def create_customer(db: Session, customer: CustomerCreate):
     db.refresh(db_customer)
     return db_customer
 
+CUSTOMER_IMPORT_FIELDS = [
+    "full_name", "contact_email", "birthdate", "national_id_number", "passport_number",
+    "tin_number", "country_of_origin", "denied_visa"
+]
+
+CUSTOMER_IMPORT_MERGE = f"""
+    WITH staged AS (
+        SELECT nextval(pg_get_serial_sequence('customers', 'id')) AS id, s.*
+        FROM customer_import_staging s
+        ORDER BY s.line
+    ), inserted AS (
+        INSERT INTO customers (id, {", ".join(CUSTOMER_IMPORT_FIELDS)})
+        SELECT id, {", ".join(CUSTOMER_IMPORT_FIELDS)} FROM staged
+        ON CONFLICT DO NOTHING
+        RETURNING id
+    )
+    SELECT staged.line FROM staged LEFT JOIN inserted USING (id)
+    WHERE inserted.id IS NULL
+    ORDER BY staged.line
+"""
+
+def _copy_row(values) -> str:
+    # COPY only reads the unquoted \N as NULL; every value is quoted, so an empty string stays an empty string
+    return ",".join(r"\N" if value is None else '"' + str(value).replace('"', '""') + '"' for value in values) + "\n"
+
+def _copy_customer_batch(cursor, buffer: io.StringIO):
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY customer_import_staging (line, {', '.join(CUSTOMER_IMPORT_FIELDS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer
+    )
+    buffer.seek(0)
+    buffer.truncate()
+
+def import_customers(db: Session, rows, batch_size: int = 5000):
+    """Load validated (line, CustomerCreate, error) rows with COPY into a staging table, then merge them into customers.
+
+    PostgreSQL only. The rows must already be validated against CustomerCreate, which mirrors the table's
+    constraints; rows that collide with an existing national_id_number, passport_number or tin_number are
+    skipped and reported.
+    """
+    cursor = db.connection().connection.cursor()
+    cursor.execute("""
+        CREATE TEMP TABLE customer_import_staging (
+            line INTEGER NOT NULL,
+            full_name TEXT,
+            contact_email TEXT,
+            birthdate DATE,
+            national_id_number TEXT,
+            passport_number TEXT,
+            tin_number TEXT,
+            country_of_origin TEXT,
+            denied_visa BOOLEAN
+        ) ON COMMIT DROP
+    """)
+
+    errors = []
+    staged = 0
+    buffer = io.StringIO()
+    for line, customer, error in rows:
+        if error:
+            errors.append({"line": line, "error": error})
+            continue
+        buffer.write(_copy_row([line] + [getattr(customer, field) for field in CUSTOMER_IMPORT_FIELDS]))
+        staged += 1
+        if staged % batch_size == 0:
+            _copy_customer_batch(cursor, buffer)
+    _copy_customer_batch(cursor, buffer)
+
+    skipped = [line for (line,) in db.execute(text(CUSTOMER_IMPORT_MERGE))]
+    db.commit()
+
+    errors.extend({"line": line, "error": "Customer with the same national_id_number, passport_number or tin_number already exists"} for line in skipped)
+    errors.sort(key=lambda error: error["line"])
+    return {"inserted": staged - len(skipped), "errors": errors}
+
 def get_customer(db: Session, customer_id: int):
     return db.query(Customer).filter(Customer.id == customer_id).first()
 
 def get_customers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Customer).offset(skip).limit(limit).all()
+    return _select_page(db, CUSTOMER_COLUMNS, skip, limit)
 
 def create_buy(db: Session, buy: BuyCreate):
     db_buy = Buy(
@@ -285,8 +421,44 @@ def create_buy(db: Session, buy: BuyCreate):
     db.refresh(db_buy)
     return db_buy
 
+def _restore_archived_documents(db: Session, buys: list[Buy]):
+    # Documents of old buys live in buy_documents_archive; load them back without marking the buy dirty
+    archived = {buy.id: buy for buy in buys if buy.documents_archived}
+    if not archived:
+        return buys
+    for documents in db.query(BuyDocumentArchive).filter(BuyDocumentArchive.buy_id.in_(archived)):
+        for column in BUY_DOCUMENT_COLUMNS:
+            set_committed_value(archived[documents.buy_id], column, getattr(documents, column))
+    return buys
+
 def get_buy(db: Session, buy_id: int):
-    return db.query(Buy).filter(Buy.id == buy_id).first()
+    buy = db.query(Buy).filter(Buy.id == buy_id).first()
+    if buy:
+        _restore_archived_documents(db, [buy])
+    return buy
 
 def get_buys_by_customer(db: Session, customer_id: int, skip: int = 0, limit: int = 100):
-    return db.query(Buy).filter(Buy.customer_id == customer_id).offset(skip).limit(limit).all()
+    buys = (
+        db.query(Buy).filter(Buy.customer_id == customer_id)
+        .order_by(Buy.created_at, Buy.id)
+        .offset(skip).limit(limit).all()
+    )
+    return _restore_archived_documents(db, buys)
+
+CUSTOMER_EXPORT_COLUMNS = CUSTOMER_COLUMNS
+
+# Document columns are left out on purpose: exports only carry the scalar fields
+BUY_EXPORT_COLUMNS = [
+    Buy.id, Buy.customer_id, Buy.surgery_id, Buy.tier_list_id, Buy.price, Buy.schengen_area, Buy.created_at
+]
+
+def _stream_rows(db: Session, columns, chunk_size: int):
+    stmt = select(*columns).order_by(columns[0]).execution_options(stream_results=True, yield_per=chunk_size)
+    for row in db.execute(stmt).mappings():
+        yield row
+
+def stream_customers(db: Session, chunk_size: int = 1000):
+    return _stream_rows(db, CUSTOMER_EXPORT_COLUMNS, chunk_size)
+
+def stream_buys(db: Session, chunk_size: int = 1000):
+    return _stream_rows(db, BUY_EXPORT_COLUMNS, chunk_size)
@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
-import os
+from fastapi import Request
+import itertools, os, time
+from . import admission, cancellation
 
 load_dotenv()
 
@@ -16,10 +18,109 @@ SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL')
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional read replicas, comma separated. Read-only routes use them round-robin.
+REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv('REPLICA_DATABASE_URLS', '').split(',') if url.strip()]
+# After a write the client reads from the primary for this many seconds
+READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+PRIMARY_PIN_COOKIE = "db_primary_pin"
+
+def parse_statement_timeouts(value: str) -> dict[str, int]:
+    timeouts = {}
+    for item in value.split(','):
+        route, _, timeout = item.rpartition('=')
+        if route.strip() and timeout.strip():
+            timeouts[route.strip()] = int(timeout)
+    return timeouts
+
+# statement_timeout in ms for request queries, by route path, e.g. "/customers/{customer_id}/buys/=2000,/files/{file_id}=10000"
+STATEMENT_TIMEOUTS = parse_statement_timeouts(os.getenv('STATEMENT_TIMEOUTS', ''))
+# 0 leaves queries of other routes unbounded
+DEFAULT_STATEMENT_TIMEOUT_MS = int(os.getenv('DEFAULT_STATEMENT_TIMEOUT_MS', 30000))
+
+replica_engines = [create_engine(url) for url in REPLICA_DATABASE_URLS]
+_replica_cycle = itertools.cycle(replica_engines)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Session.info keys: request sessions report their wait for a pooled connection to admission control
+MEASURE_POOL_WAIT = "measure_pool_wait"
+POOL_WAIT_STARTED = "pool_wait_started"
+
+@event.listens_for(SessionLocal, "after_transaction_create")
+def _start_pool_wait(session, transaction):
+    # The session autobegins on its first query and only then checks a connection out of the pool
+    if transaction.parent is None and session.info.get(MEASURE_POOL_WAIT):
+        session.info[POOL_WAIT_STARTED] = time.perf_counter()
+
+def _record_pool_wait(session):
+    started = session.info.pop(POOL_WAIT_STARTED, None)
+    if started is not None:
+        admission.pool_waits.record(time.perf_counter() - started)
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _end_pool_wait(session, transaction):
+    # A checkout that timed out never begins, and its wait is the one that matters most
+    _record_pool_wait(session)
+
+@event.listens_for(SessionLocal, "after_begin")
+def _prepare_transaction(session, transaction, connection):
+    _record_pool_wait(session)
+    timeout = session.info.get("statement_timeout_ms")
+    if timeout and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+    watcher = session.info.get(cancellation.SCOPE_KEY)
+    if watcher is not None:
+        connection.connection.info[cancellation.SCOPE_KEY] = watcher
+        watcher.track(connection.connection.dbapi_connection)
+
+def _release_connection(dbapi_connection, connection_record):
+    watcher = connection_record.info.pop(cancellation.SCOPE_KEY, None)
+    if watcher is not None:
+        watcher.untrack(dbapi_connection)
+
+for _engine in (engine, *replica_engines):
+    event.listen(_engine, "checkin", _release_connection)
+
+def statement_timeout_for(route_path: str) -> int:
+    return STATEMENT_TIMEOUTS.get(route_path, DEFAULT_STATEMENT_TIMEOUT_MS)
+
+def _route_path(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", request.scope.get("path", ""))
+
+def _checkout(db, request: Request):
+    # No connection yet: the pool is only hit, and the wait recorded for admission control, on the first query
+    db.info["statement_timeout_ms"] = statement_timeout_for(_route_path(request))
+    db.info[MEASURE_POOL_WAIT] = True
+    watcher = request.scope.get(cancellation.SCOPE_KEY)
+    if watcher is not None:
+        db.info[cancellation.SCOPE_KEY] = watcher
+    return db
+
+def get_db(request: Request):
+    db = _checkout(SessionLocal(), request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def read_session(pin_primary: bool = False, statement_timeout_ms: int = 0):
+    if pin_primary or not replica_engines:
+        db = SessionLocal()
+    else:
+        db = SessionLocal(bind=next(_replica_cycle))
+    if statement_timeout_ms:
+        db.info["statement_timeout_ms"] = statement_timeout_ms
+    return db
+
+def is_pinned_to_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def get_read_db(request: Request):
+    db = _checkout(read_session(pin_primary=is_pinned_to_primary(request)), request)
     try:
         yield db
     finally:
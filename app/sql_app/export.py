@@ -0,0 +1,48 @@
+import csv, io, json
+from datetime import date, datetime
+from decimal import Decimal
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def iter_ndjson(rows, batch_size: int = 500):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(dict(row), default=_default))
+        if len(buffer) >= batch_size:
+            yield "\n".join(buffer) + "\n"
+            buffer.clear()
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
+def iter_csv(rows, fieldnames: list[str], batch_size: int = 500):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_export(rows, columns, export_format: str):
+    if export_format == "csv":
+        return iter_csv(rows, [column.key for column in columns])
+    return iter_ndjson(rows)
@@ -0,0 +1,203 @@
+import asyncio, json, logging, os, time, uuid
+from datetime import datetime, timedelta, timezone
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from .database import SessionLocal
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+IDEMPOTENT_ROUTES = {("POST", "/buys/"), ("POST", "/customers/"), ("POST", "/upload/")}
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+# How long a retry waits for the original request to finish before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 30))
+# A running request renews its claim every third of this; a claim left by a dead worker can be taken over once it lapses
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 15))
+PURGE_INTERVAL_SECONDS = 60
+MAX_KEY_LENGTH = 255
+
+CLAIMED = "claimed"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+_last_purge = 0.0
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _purge_expired(db, now: datetime):
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = time.monotonic()
+    db.query(IdempotencyKey).filter(IdempotencyKey.expires_at < now).delete(synchronize_session=False)
+    db.commit()
+
+
+def _key_filter(key: str, method: str, path: str):
+    return (IdempotencyKey.key == key, IdempotencyKey.method == method, IdempotencyKey.path == path)
+
+
+def claim(key: str, method: str, path: str, owner: str):
+    """Returns (CLAIMED, None) for the first request, (COMPLETED, record) or (IN_PROGRESS, None) for retries.
+
+    Expired rows are replaced: completed responses past their TTL and in_progress claims whose lease lapsed.
+    """
+    db = SessionLocal()
+    try:
+        now = _utcnow()
+        _purge_expired(db, now)
+        db.query(IdempotencyKey).filter(
+            *_key_filter(key, method, path), IdempotencyKey.expires_at < now
+        ).delete(synchronize_session=False)
+        db.add(IdempotencyKey(
+            key=key, method=method, path=path, status=IN_PROGRESS, owner=owner,
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+        ))
+        try:
+            db.commit()
+            return CLAIMED, None
+        except IntegrityError:
+            db.rollback()
+
+        record = db.query(IdempotencyKey).filter(*_key_filter(key, method, path)).first()
+        if record is None:
+            # The first request failed and released the key in the meantime
+            return claim(key, method, path, owner)
+        if record.status == COMPLETED:
+            return COMPLETED, record
+        return IN_PROGRESS, None
+    finally:
+        db.close()
+
+
+def renew(key: str, method: str, path: str, owner: str) -> bool:
+    """Extends the lease of a running request; False if another request took the key over."""
+    db = SessionLocal()
+    try:
+        renewed = db.query(IdempotencyKey).filter(
+            *_key_filter(key, method, path), IdempotencyKey.owner == owner, IdempotencyKey.status == IN_PROGRESS
+        ).update({"expires_at": _utcnow() + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}, synchronize_session=False)
+        db.commit()
+        return renewed > 0
+    finally:
+        db.close()
+
+
+def complete(key: str, method: str, path: str, owner: str, status: int, headers: list, body: bytes):
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyKey).filter(*_key_filter(key, method, path), IdempotencyKey.owner == owner).update({
+            "status": COMPLETED,
+            "response_status": status,
+            "response_headers": json.dumps(headers),
+            "response_body": body,
+            "expires_at": _utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def release(key: str, method: str, path: str, owner: str):
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyKey).filter(
+            *_key_filter(key, method, path), IdempotencyKey.owner == owner
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _keep_lease(key: str, method: str, path: str, owner: str):
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+        try:
+            if not await run_in_threadpool(renew, key, method, path, owner):
+                logger.warning("Idempotency-Key %s was taken over while its request was still running", key)
+                return
+        except Exception as e:
+            logger.error("Failed to renew the Idempotency-Key lease: %s", e)
+
+
+async def _send_json(send, status: int, detail: str, headers: list | None = None):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _replay(send, record: IdempotencyKey):
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(record.response_headers or "[]")]
+    await send({"type": "http.response.start", "status": record.response_status, "headers": headers + [(b"idempotent-replayed", b"true")]})
+    await send({"type": "http.response.body", "body": record.response_body or b""})
+
+
+class IdempotencyMiddleware:
+    """Replays the stored response of POST /buys/, /customers/ and /upload/ when the Idempotency-Key header repeats.
+
+    Retries are answered before the request body is read. A retry that arrives while the first request is
+    still running waits for it to finish, or takes the key over if that request stopped renewing its lease
+    (e.g. its worker died). 5xx responses are not stored, so the client can try again.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES:
+            return await self.app(scope, receive, send)
+        key = next((value.decode("latin-1") for name, value in scope["headers"] if name == IDEMPOTENCY_HEADER), None)
+        if not key:
+            return await self.app(scope, receive, send)
+        if len(key) > MAX_KEY_LENGTH:
+            return await _send_json(send, 400, f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+        method, path = scope["method"], scope["path"]
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.05
+        while True:
+            state, record = await run_in_threadpool(claim, key, method, path, owner)
+            if state == COMPLETED:
+                return await _replay(send, record)
+            if state == CLAIMED:
+                break
+            if time.monotonic() >= deadline:
+                return await _send_json(send, 409, "A request with this Idempotency-Key is still being processed", [(b"retry-after", b"1")])
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    [name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in message.get("headers", []) if name.lower() != b"set-cookie"
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        lease = asyncio.create_task(_keep_lease(key, method, path, owner))
+        try:
+            await self.app(scope, receive, capture_send)
+        except BaseException:
+            await run_in_threadpool(release, key, method, path, owner)
+            raise
+        finally:
+            lease.cancel()
+
+        if response["status"] >= 500:
+            await run_in_threadpool(release, key, method, path, owner)
+        else:
+            await run_in_threadpool(complete, key, method, path, owner, response["status"], response["headers"], b"".join(response["body"]))
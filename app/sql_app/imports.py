@@ -0,0 +1,49 @@
+import csv, io, json
+from pydantic import ValidationError
+from .schemas import CustomerCreate
+
+
+def is_csv(filename: str | None, content_type: str | None) -> bool:
+    return (filename or "").lower().endswith(".csv") or (content_type or "").startswith("text/csv")
+
+
+def iter_csv_records(text):
+    reader = csv.DictReader(text)
+    for row in reader:
+        # Empty cells are missing values, not empty strings
+        yield reader.line_num, {key: value if value != "" else None for key, value in row.items()}
+
+
+def iter_ndjson_records(text):
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, e
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+def iter_customers(binary_file, filename: str | None = None, content_type: str | None = None):
+    """Yield (line, CustomerCreate | None, error | None) for every record of an uploaded CSV/NDJSON file."""
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        records = iter_csv_records(text) if is_csv(filename, content_type) else iter_ndjson_records(text)
+        for line, record in records:
+            if isinstance(record, Exception):
+                yield line, None, f"Invalid JSON: {record.msg}"
+                continue
+            if not isinstance(record, dict):
+                yield line, None, "Expected a JSON object"
+                continue
+            try:
+                yield line, CustomerCreate.model_validate(record), None
+            except ValidationError as e:
+                yield line, None, _format_validation_error(e)
+    finally:
+        # Leave the upload's file open, it is closed by FastAPI
+        text.detach()
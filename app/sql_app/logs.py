@@ -0,0 +1,144 @@
+import atexit, copy, json, logging, os, queue, random, sys, time, uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of successful requests whose access log line is kept, e.g. "/partners=0.01,/surgeries=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+REQUEST_ID_HEADER = b"x-request-id"
+# Set on the scope by middlewares whose error responses are expected under load, such as admission
+# control shedding; those are sampled like successful requests instead of always logged
+SAMPLED_ERROR_SCOPE_KEY = "access_log.sampled_error"
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+access_logger = logging.getLogger("access")
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+_listener = None
+
+
+def parse_sample_rates(value: str) -> list[tuple[str, float]]:
+    rates = []
+    for item in value.split(","):
+        prefix, _, rate = item.partition("=")
+        if prefix.strip() and rate.strip():
+            rates.append((prefix.strip(), float(rate)))
+    # Longest prefix wins
+    return sorted(rates, key=lambda item: len(item[0]), reverse=True)
+
+
+_sample_rates = parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def sample_rate(path: str) -> float:
+    for prefix, rate in _sample_rates:
+        if path.startswith(prefix):
+            return rate
+    return LOG_SAMPLE_RATE
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request id. Runs in the logging thread, before the record is queued."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class ExcInfoQueueHandler(QueueHandler):
+    """QueueHandler that leaves the exception on the record, so the formatter can emit it as its own field.
+
+    The stock prepare() merges the formatted traceback into the message and drops exc_info, which is
+    only needed when the queue pickles records across processes.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging():
+    """Routes all logging through a queue; a background listener thread formats and writes the records."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ExcInfoQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class AccessLogMiddleware:
+    """Assigns every request an id (taken from X-Request-ID when the client sends one) and writes a sampled access log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = next((value.decode("latin-1") for name, value in scope["headers"] if name == REQUEST_ID_HEADER), None)
+        request_id = (request_id or uuid.uuid4().hex)[:64]
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            # Errors are always logged, successful requests and shed load only for the sampled fraction of their route
+            always = status_code >= 500 and not scope.get(SAMPLED_ERROR_SCOPE_KEY)
+            if always or random.random() < sample_rate(scope["path"]):
+                access_logger.info(
+                    "%s %s %s", scope["method"], scope["path"], status_code,
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status_code": status_code,
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    }
+                )
+            request_id_var.reset(token)
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, DateTime, func, Boolean, Date, Text
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, DateTime, func, false, Boolean, Date, Text
 from sqlalchemy.orm import relationship
 from .database import Base
+from .storage import CompressedBinary
 
 class Email(Base):
     __tablename__ = "emails"
@@ -10,6 +11,8 @@ class Email(Base):
     mail_to = Column(String, index=True)
     subject = Column(String)
     message = Column(String)
+    # Partition key of the monthly partitions in PostgreSQL
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
 
 class Partner(Base):
     __tablename__ = 'partners'
@@ -65,9 +68,32 @@ class PDFFile(Base):
     id = Column(Integer, primary_key=True, index=True)
     file_name = Column(String, nullable=False)
     upload_date = Column(DateTime, server_default=func.now())
-    file_data = Column(LargeBinary, nullable=False)
+    file_data = Column(CompressedBinary, nullable=False)
     description = Column(String)
 
+    # Filled in by the PDF post-processing pipeline
+    page_count = Column(Integer, nullable=True)
+    pdf_metadata = Column(Text, nullable=True)  # JSON document info (title, author, ...)
+    text_content = Column(Text, nullable=True)
+    thumbnail = Column(LargeBinary, nullable=True)  # PNG of the first page
+    processed_at = Column(DateTime, nullable=True)
+
+    jobs = relationship("PDFJob", back_populates="pdf_file", cascade="all, delete-orphan")
+
+class PDFJob(Base):
+    __tablename__ = 'pdf_jobs'
+
+    id = Column(Integer, primary_key=True, index=True)
+    pdf_file_id = Column(Integer, ForeignKey('pdf_files.id', ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending, running, done or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    pdf_file = relationship("PDFFile", back_populates="jobs")
+
 class Customer(Base):
     __tablename__ = 'customers'
 
@@ -97,29 +123,73 @@ class Buy(Base):
     price = Column(String, nullable=False)
 
     # File fields
-    valid_photo = Column(LargeBinary, nullable=True)  # Store file as binary data
-    id_scan = Column(LargeBinary, nullable=True)
-    medical_dossier = Column(LargeBinary, nullable=True)
-    trip_clearance_doc = Column(LargeBinary, nullable=True)
+    valid_photo = Column(CompressedBinary, nullable=True)  # Store file as binary data, compressed per STORAGE_CODEC
+    id_scan = Column(CompressedBinary, nullable=True)
+    medical_dossier = Column(CompressedBinary, nullable=True)
+    trip_clearance_doc = Column(CompressedBinary, nullable=True)
     schengen_area = Column(Boolean, nullable=False)
-    oral_care_implant_plan = Column(LargeBinary, nullable=True)
-    hair_care_implant_plan = Column(LargeBinary, nullable=True)
-    visa_documents = Column(LargeBinary, nullable=True)
-    visa_application_form = Column(LargeBinary, nullable=True)
-    identical_photos = Column(LargeBinary, nullable=True)
-    passport_copy = Column(LargeBinary, nullable=True)
-    medical_travel_insurance = Column(LargeBinary, nullable=True)
-    proof_of_financial_means = Column(LargeBinary, nullable=True)
-    guarantee_letter = Column(LargeBinary, nullable=True)
+    oral_care_implant_plan = Column(CompressedBinary, nullable=True)
+    hair_care_implant_plan = Column(CompressedBinary, nullable=True)
+    visa_documents = Column(CompressedBinary, nullable=True)
+    visa_application_form = Column(CompressedBinary, nullable=True)
+    identical_photos = Column(CompressedBinary, nullable=True)
+    passport_copy = Column(CompressedBinary, nullable=True)
+    medical_travel_insurance = Column(CompressedBinary, nullable=True)
+    proof_of_financial_means = Column(CompressedBinary, nullable=True)
+    guarantee_letter = Column(CompressedBinary, nullable=True)
+
+    # Partition key of the monthly partitions in PostgreSQL
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    # Set once the document columns have been moved to buy_documents_archive
+    documents_archived = Column(Boolean, nullable=False, server_default=false())
 
     # Relationships
     customer = relationship("Customer", back_populates="buys")
     surgery = relationship("Surgery")  # Relationship to Surgery
     tier_list = relationship("TierList")  # Relationship to TierList
 
+BUY_DOCUMENT_COLUMNS = (
+    "valid_photo", "id_scan", "medical_dossier", "trip_clearance_doc", "oral_care_implant_plan",
+    "hair_care_implant_plan", "visa_documents", "visa_application_form", "identical_photos", "passport_copy",
+    "medical_travel_insurance", "proof_of_financial_means", "guarantee_letter"
+)
+
+class BuyDocumentArchive(Base):
+    __tablename__ = 'buy_documents_archive'
+
+    buy_id = Column(Integer, primary_key=True)
+    valid_photo = Column(CompressedBinary, nullable=True)
+    id_scan = Column(CompressedBinary, nullable=True)
+    medical_dossier = Column(CompressedBinary, nullable=True)
+    trip_clearance_doc = Column(CompressedBinary, nullable=True)
+    oral_care_implant_plan = Column(CompressedBinary, nullable=True)
+    hair_care_implant_plan = Column(CompressedBinary, nullable=True)
+    visa_documents = Column(CompressedBinary, nullable=True)
+    visa_application_form = Column(CompressedBinary, nullable=True)
+    identical_photos = Column(CompressedBinary, nullable=True)
+    passport_copy = Column(CompressedBinary, nullable=True)
+    medical_travel_insurance = Column(CompressedBinary, nullable=True)
+    proof_of_financial_means = Column(CompressedBinary, nullable=True)
+    guarantee_letter = Column(CompressedBinary, nullable=True)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
 class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    method = Column(String(10), primary_key=True)
+    path = Column(String(255), primary_key=True)
+    status = Column(String(20), nullable=False)  # in_progress or completed
+    owner = Column(String(32), nullable=True)  # random id of the request holding the in_progress lease
+    response_status = Column(Integer, nullable=True)
+    response_headers = Column(Text, nullable=True)  # JSON list of [name, value] pairs
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)  # end of the lease while in_progress, of the stored response once completed
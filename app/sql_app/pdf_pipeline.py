@@ -0,0 +1,261 @@
+import json, logging, multiprocessing, os, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_
+from .database import SessionLocal
+from .models import PDFJob
+
+try:
+    import pymupdf
+except ImportError:  # jobs fail with a clear error until PyMuPDF is installed
+    pymupdf = None
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", 2))
+PDF_JOB_POLL_SECONDS = float(os.getenv("PDF_JOB_POLL_SECONDS", 5))
+# A job still running after this long is killed along with its pool process and retried
+PDF_JOB_TIMEOUT_SECONDS = int(os.getenv("PDF_JOB_TIMEOUT_SECONDS", 300))
+# A running job left this long is assumed to belong to a dead worker and is picked up again. Twice the
+# timeout, so a live worker has always given up on the job before another one claims it.
+STALE_JOB_SECONDS = 2 * PDF_JOB_TIMEOUT_SECONDS
+PDF_JOB_MAX_ATTEMPTS = 3
+MAX_TEXT_CHARS = 1_000_000
+THUMBNAIL_WIDTH = 256
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def extract_pdf(data: bytes) -> dict:
+    """Page count, document info, text and a first-page PNG thumbnail. Runs in a pool process."""
+    if pymupdf is None:
+        raise RuntimeError("PDF processing requires the 'pymupdf' package")
+    with pymupdf.open(stream=data, filetype="pdf") as document:
+        text_parts = []
+        text_length = 0
+        for page in document:
+            if text_length >= MAX_TEXT_CHARS:
+                break
+            page_text = page.get_text()
+            text_parts.append(page_text)
+            text_length += len(page_text)
+
+        thumbnail = None
+        if document.page_count:
+            first_page = document[0]
+            zoom = THUMBNAIL_WIDTH / first_page.rect.width
+            thumbnail = first_page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom)).tobytes("png")
+
+        return {
+            "page_count": document.page_count,
+            "pdf_metadata": json.dumps({key: value for key, value in (document.metadata or {}).items() if value}),
+            "text_content": "".join(text_parts)[:MAX_TEXT_CHARS],
+            "thumbnail": thumbnail,
+        }
+
+
+def claim_job(exclude: frozenset = frozenset()):
+    """Marks the oldest runnable job as running and returns (job_id, file bytes), or None.
+
+    `exclude` holds the jobs the calling worker is still running, which it must not claim a second time.
+    """
+    db = SessionLocal()
+    try:
+        now = _utcnow()
+        query = db.query(PDFJob).filter(or_(
+            PDFJob.status == PENDING,
+            (PDFJob.status == RUNNING) & (PDFJob.started_at < now - timedelta(seconds=STALE_JOB_SECONDS))
+        ))
+        if exclude:
+            query = query.filter(PDFJob.id.notin_(exclude))
+        job = (
+            query
+            .order_by(PDFJob.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            return None
+        if job.attempts >= PDF_JOB_MAX_ATTEMPTS:
+            job.status = FAILED
+            job.error = job.error or "Gave up after repeated timeouts"
+            job.finished_at = now
+            db.commit()
+            return claim_job(exclude)
+        job.status = RUNNING
+        job.attempts += 1
+        job.started_at = now
+        db.commit()
+        return job.id, job.pdf_file.file_data
+    finally:
+        db.close()
+
+
+def finish_job(job_id: int, result: dict | None = None, error: str | None = None, retry: bool = False):
+    """Stores the result, or the error of a failed attempt. `retry` requeues a job interrupted through no fault of its own."""
+    db = SessionLocal()
+    try:
+        job = db.query(PDFJob).filter(PDFJob.id == job_id).first()
+        if job is None:
+            return
+        now = _utcnow()
+        if error is None:
+            for key, value in result.items():
+                setattr(job.pdf_file, key, value)
+            job.pdf_file.processed_at = now
+            job.status = DONE
+            job.error = None
+        elif retry:
+            job.status = PENDING
+            job.attempts = max(job.attempts - 1, 0)
+            job.error = error
+        else:
+            job.status = PENDING if job.attempts < PDF_JOB_MAX_ATTEMPTS else FAILED
+            job.error = error
+        job.finished_at = now
+        db.commit()
+    finally:
+        db.close()
+
+
+class PdfJobWorker:
+    """Feeds pending pdf_jobs rows to a process pool and stores the results on the pdf_files row.
+
+    Jobs running longer than `timeout` seconds are failed and the pool is recycled, since the only way
+    to stop a hung PyMuPDF call is to kill its process.
+    """
+
+    def __init__(self, workers: int = PDF_WORKERS, timeout: float = PDF_JOB_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.timeout = timeout
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._slots = threading.Semaphore(workers)
+        # job id -> monotonic deadline of the jobs submitted to the current pool
+        self._running: dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._thread = None
+
+    def start(self):
+        self._pool = self._new_pool()
+        self._thread = threading.Thread(target=self._run, name="pdf-job-worker", daemon=True)
+        self._thread.start()
+
+    def _new_pool(self):
+        # spawn rather than fork: the parent runs threads and holds pooled database connections
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _recycle_pool(self):
+        pool, self._pool = self._pool, self._new_pool()
+        # shutdown() leaves running tasks alone and there is no public way to kill them before Python 3.14
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        if self._pool:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _seconds_to_next_deadline(self) -> float:
+        with self._lock:
+            if not self._running:
+                return PDF_JOB_POLL_SECONDS
+            return max(0.0, min(min(self._running.values()) - time.monotonic(), PDF_JOB_POLL_SECONDS))
+
+    def _expire_timed_out_jobs(self):
+        now = time.monotonic()
+        with self._lock:
+            if not any(deadline <= now for deadline in self._running.values()):
+                return
+            running, self._running = self._running, {}
+        self._recycle_pool()
+        for job_id, deadline in running.items():
+            timed_out = deadline <= now
+            if timed_out:
+                logger.warning("PDF job %s timed out after %s s", job_id, self.timeout)
+            try:
+                if timed_out:
+                    finish_job(job_id, error=f"Timed out after {self.timeout} s")
+                else:
+                    finish_job(job_id, error="Interrupted by a pool restart", retry=True)
+            except Exception as e:
+                logger.error("Failed to record PDF job %s: %s", job_id, e)
+            finally:
+                self._slots.release()
+
+    def _running_jobs(self) -> frozenset:
+        with self._lock:
+            return frozenset(self._running)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._expire_timed_out_jobs()
+            # Wake up for the next deadline even when every slot is busy
+            if not self._slots.acquire(timeout=self._seconds_to_next_deadline()):
+                continue
+            try:
+                claimed = claim_job(self._running_jobs())
+            except Exception as e:
+                logger.error("Failed to claim a PDF job: %s", e)
+                claimed = None
+            if claimed is None:
+                self._slots.release()
+                self._wakeup.wait(self._seconds_to_next_deadline())
+                self._wakeup.clear()
+                continue
+            job_id, file_data = claimed
+            try:
+                future = self._pool.submit(extract_pdf, file_data)
+            except BrokenProcessPool as e:
+                logger.error("PDF process pool is broken, restarting it: %s", e)
+                self._recycle_pool()
+                finish_job(job_id, error=str(e))
+                self._slots.release()
+                continue
+            with self._lock:
+                self._running[job_id] = time.monotonic() + self.timeout
+            future.add_done_callback(lambda future, job_id=job_id: self._on_done(job_id, future))
+
+    def _on_done(self, job_id: int, future):
+        with self._lock:
+            # Already failed and its slot released by the timeout
+            if self._running.pop(job_id, None) is None:
+                return
+        try:
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                finish_job(job_id, result=future.result())
+            else:
+                logger.warning("PDF job %s failed: %s", job_id, error)
+                finish_job(job_id, error=str(error) or type(error).__name__)
+        except Exception as e:
+            logger.error("Failed to record PDF job %s: %s", job_id, e)
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+
+
+worker = PdfJobWorker() if PDF_WORKERS > 0 else None
+
+
+def notify():
+    if worker is not None:
+        worker.notify()
@@ -0,0 +1,234 @@
+import asyncio, functools, json, logging, os, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from . import auth
+from .database import SessionLocal
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # profiling is disabled without pyinstrument
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = b"profile="
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.001))
+
+# State of the request being profiled; None for every other request. The dict is shared with the
+# threadpool calls of the request, which run in a copy of its context.
+_profile: ContextVar[dict | None] = ContextVar("profile", default=None)
+
+
+def _new_state() -> dict:
+    return {"sql": [], "serialization": 0.0, "endpoint_returned": None, "endpoint_profilers": []}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _profile.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = _profile.get()
+    if state is not None and conn.info.get("profile_query_start"):
+        started = conn.info["profile_query_start"].pop()
+        state["sql"].append({"statement": statement, "duration_ms": round((time.perf_counter() - started) * 1000, 3)})
+
+
+def install_sql_timing(*engines):
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# Flag values that turn profiling on, and the output format they select; anything else, such as 0, leaves it off
+PROFILE_FORMATS = {"1": "json", "true": "json", "json": "json", "html": "html"}
+
+
+def _requested_format(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return PROFILE_FORMATS.get(value.decode("latin-1").strip().lower())
+    query_string = scope.get("query_string", b"")
+    if PROFILE_QUERY_PARAM in query_string:
+        values = parse_qs(query_string.decode("latin-1")).get("profile")
+        if values:
+            return PROFILE_FORMATS.get(values[0].strip().lower())
+    return None
+
+
+def _bearer_token(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+    return None
+
+
+def _is_admin(token: str) -> bool:
+    db = SessionLocal()
+    try:
+        auth.get_current_user(db, token)
+        return True
+    except HTTPException:
+        return False
+    finally:
+        db.close()
+
+
+@contextmanager
+def serializing():
+    """Counts the time spent in the block as serialization time of the request being profiled."""
+    state = _profile.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if state is not None:
+            state["serialization"] += time.perf_counter() - started
+
+
+def _endpoint_returned(state: dict, result):
+    # FastAPI validates and encodes anything but a Response after the endpoint returns
+    state["endpoint_returned"] = None if isinstance(result, Response) else time.perf_counter()
+
+
+def profile_in_thread(call):
+    """Samples a function run in the threadpool, which the event loop profiler does not see, when the request is profiled."""
+    @functools.wraps(call)
+    def profiled(*args, **kwargs):
+        state = _profile.get()
+        if state is None or Profiler is None:
+            return call(*args, **kwargs)
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="disabled")
+        profiler.start()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            profiler.stop()
+            state["endpoint_profilers"].append(profiler)
+    return profiled
+
+
+def _profiled_endpoint(call):
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def profiled_async(*args, **kwargs):
+            result = await call(*args, **kwargs)
+            state = _profile.get()
+            if state is not None:
+                _endpoint_returned(state, result)
+            return result
+        return profiled_async
+
+    sampled = profile_in_thread(call)
+
+    @functools.wraps(call)
+    def profiled(*args, **kwargs):
+        result = sampled(*args, **kwargs)
+        state = _profile.get()
+        if state is not None:
+            _endpoint_returned(state, result)
+        return result
+    return profiled
+
+
+class ProfiledRoute(APIRoute):
+    """Route class that profiles `def` endpoints in their worker thread and times FastAPI's response serialization."""
+
+    def get_route_handler(self):
+        self.dependant.call = _profiled_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request):
+            response = await handler(request)
+            state = _profile.get()
+            if state is not None and state["endpoint_returned"] is not None:
+                state["serialization"] += time.perf_counter() - state["endpoint_returned"]
+                state["endpoint_returned"] = None
+            return response
+        return profiled_handler
+
+
+class ProfilingMiddleware:
+    """Returns a profile of the request instead of its response when an admin sends `X-Profile` or `?profile=`.
+
+    Use `X-Profile: html` for pyinstrument's interactive report, `1`, `true` or `json` for a JSON summary.
+    The event loop thread is sampled here; `def` endpoints are sampled in their worker thread by
+    ProfiledRoute, which must be the app's route class.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or Profiler is None:
+            return await self.app(scope, receive, send)
+        profile_format = _requested_format(scope)
+        if profile_format is None:
+            return await self.app(scope, receive, send)
+        token = _bearer_token(scope)
+        if token is None or not await run_in_threadpool(_is_admin, token):
+            return await self.app(scope, receive, send)
+
+        response = {"status_code": None, "body_bytes": 0}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body_bytes"] += len(message.get("body", b""))
+
+        state = _new_state()
+        state_token = _profile.set(state)
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, capture_send)
+        finally:
+            profiler.stop()
+            _profile.reset(state_token)
+        duration = time.perf_counter() - started
+        sql_log = state["sql"]
+        endpoint_profilers = state["endpoint_profilers"]
+
+        if profile_format == "html":
+            # The endpoint's own thread is where a `def` endpoint spends its time
+            body = (endpoint_profilers[-1] if endpoint_profilers else profiler).output_html().encode()
+            content_type = b"text/html; charset=utf-8"
+        else:
+            body = json.dumps({
+                "method": scope["method"],
+                "path": scope["path"],
+                "status_code": response["status_code"],
+                "response_bytes": response["body_bytes"],
+                "duration_ms": round(duration * 1000, 3),
+                "serialization_ms": round(state["serialization"] * 1000, 3),
+                "sql": {
+                    "count": len(sql_log),
+                    "total_ms": round(sum(query["duration_ms"] for query in sql_log), 3),
+                    "statements": sql_log,
+                },
+                "profile": profiler.output_text(unicode=True, color=False),
+                "endpoint_profile": "".join(
+                    endpoint_profiler.output_text(unicode=True, color=False) for endpoint_profiler in endpoint_profilers
+                ) or None,
+            }).encode()
+            content_type = b"application/json"
+
+        logger.info("Profiled %s %s in %.1f ms", scope["method"], scope["path"], duration * 1000)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
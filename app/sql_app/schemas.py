@@ -1,6 +1,6 @@
 from typing import List, Optional, Generic, TypeVar
-from pydantic import BaseModel , Field
-from datetime import date
+from pydantic import BaseModel , Field, field_validator
+from datetime import date, datetime
 
 
 T = TypeVar('T')
@@ -45,6 +45,16 @@ class SurgeryWithLogo(BaseModel):
     partner_id: int
     logo: str
 
+class SurgerySummary(BaseModel):
+    id: int
+    surgery: str
+    surgery_description: str
+    partner_id: int
+    partner_name: str
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    tier_count: int
+
 class TierListBase(BaseModel):
     id: int
     tier: str
@@ -122,6 +132,17 @@ class PartnerResponse(BaseModel):
     result: int
     data: List[Partner]
 
+class PDFFileStatus(BaseModel):
+    file_id: int
+    file_name: str
+    job_id: Optional[int] = None
+    status: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    page_count: Optional[int] = None
+    pdf_metadata: Optional[dict] = None
+    processed_at: Optional[datetime] = None
+
 class UserBase(BaseModel):
     username: str
 
@@ -151,8 +172,28 @@ class CustomerBase(BaseModel):
     country_of_origin: str
     denied_visa: bool
 
+# Mirrors the CHECK constraint and VARCHAR(255) columns of the customers table in init.sql
+CUSTOMER_COUNTRIES = frozenset({
+    'Austria', 'Belgium', 'Bulgaria', 'Switzerland', 'Cyprus', 'Czech Republic', 'Germany', 'Denmark',
+    'Estonia', 'Greece', 'Spain', 'Finland', 'France', 'Croatia', 'Hungary', 'Ireland', 'Iceland',
+    'Italy', 'Liechtenstein', 'Lithuania', 'Luxembourg', 'Latvia', 'Malta', 'Netherlands', 'Norway',
+    'Poland', 'Portugal', 'Romania', 'Sweden', 'Slovenia', 'Slovakia', 'United Kingdom'
+})
+CUSTOMER_TEXT_MAX_LENGTH = 255
+
 class CustomerCreate(CustomerBase):
-    pass
+    full_name: str = Field(max_length=CUSTOMER_TEXT_MAX_LENGTH)
+    contact_email: str = Field(max_length=CUSTOMER_TEXT_MAX_LENGTH)
+    national_id_number: Optional[str] = Field(None, max_length=CUSTOMER_TEXT_MAX_LENGTH)
+    passport_number: Optional[str] = Field(None, max_length=CUSTOMER_TEXT_MAX_LENGTH)
+    tin_number: Optional[str] = Field(None, max_length=CUSTOMER_TEXT_MAX_LENGTH)
+
+    @field_validator("country_of_origin")
+    @classmethod
+    def check_country(cls, value: str) -> str:
+        if value not in CUSTOMER_COUNTRIES:
+            raise ValueError(f"Unsupported country '{value}', expected the full country name, e.g. 'Portugal'")
+        return value
 
 class CustomerResponse(CustomerBase):
     id: int
@@ -160,6 +201,14 @@ class CustomerResponse(CustomerBase):
     class Config:
         orm_mode = True
 
+class CustomerImportError(BaseModel):
+    line: int
+    error: str
+
+class CustomerImportReport(BaseModel):
+    inserted: int
+    errors: List[CustomerImportError]
+
 class BuyBase(BaseModel):
     valid_photo: Optional[bytes] = None
     id_scan: Optional[bytes] = None
@@ -0,0 +1,96 @@
+import os
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # zstandard is only needed when STORAGE_CODEC=zstd
+    zstandard = None
+
+# Stored values start with MAGIC followed by one codec byte. Rows written before
+# the codec was enabled have no marker and are returned untouched. Uncompressed
+# values that happen to start with MAGIC are stored behind a CODEC_RAW marker.
+MAGIC = b"\x00NGC"
+CODEC_RAW = 0
+CODEC_ZSTD = 1
+
+STORAGE_CODEC = os.getenv("STORAGE_CODEC", "none").lower()
+ZSTD_LEVEL = int(os.getenv("STORAGE_ZSTD_LEVEL", 3))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_CODECS = {"none": CODEC_RAW, "zstd": CODEC_ZSTD}
+
+
+def _codec_id(codec: str) -> int:
+    if codec not in _CODECS:
+        raise ValueError(f"Unknown storage codec: {codec}")
+    if _CODECS[codec] == CODEC_ZSTD and zstandard is None:
+        raise RuntimeError("STORAGE_CODEC=zstd requires the 'zstandard' package")
+    return _CODECS[codec]
+
+
+def is_encoded(value: bytes) -> bool:
+    return value[:len(MAGIC)] == MAGIC and len(value) > len(MAGIC)
+
+
+class Encoded(bytes):
+    """A value already in storage format, as returned by encode(); CompressedBinary stores it as is."""
+
+
+def encode(value: bytes | None, codec: str | None = None) -> Encoded | None:
+    if value is None:
+        return None
+    codec_id = _codec_id(codec or STORAGE_CODEC)
+    if codec_id == CODEC_ZSTD:
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(value)
+        # Incompressible files (JPEG scans, already-compressed PDFs) are kept as-is
+        if len(compressed) + len(MAGIC) + 1 < len(value):
+            return Encoded(MAGIC + bytes([codec_id]) + compressed)
+    if value.startswith(MAGIC):
+        return Encoded(MAGIC + bytes([CODEC_RAW]) + value)
+    return Encoded(value)
+
+
+def decode(value: bytes | None) -> bytes | None:
+    if value is None or not is_encoded(value):
+        return value
+    return b"".join(iter_decoded(value))
+
+
+def iter_decoded(value: bytes, chunk_size: int = STREAM_CHUNK_SIZE):
+    if not is_encoded(value):
+        for start in range(0, len(value), chunk_size):
+            yield value[start:start + chunk_size]
+        return
+
+    codec_id = value[len(MAGIC)]
+    payload = memoryview(value)[len(MAGIC) + 1:]
+    if codec_id == CODEC_RAW:
+        for start in range(0, len(payload), chunk_size):
+            yield bytes(payload[start:start + chunk_size])
+    elif codec_id == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Reading zstd-compressed rows requires the 'zstandard' package")
+        reader = zstandard.ZstdDecompressor().stream_reader(payload)
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        raise ValueError(f"Unknown storage codec marker: {codec_id}")
+
+
+class CompressedBinary(TypeDecorator):
+    """LargeBinary column that compresses on write with the configured STORAGE_CODEC."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, Encoded):
+            return bytes(value)
+        return encode(value)
+
+    def process_result_value(self, value, dialect):
+        return decode(value)
@@ -0,0 +1,92 @@
+# tests/fake_redis.py
+
+import socket, socketserver, threading, time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Speaks just enough RESP2 for the cache backend: PING, GET, SET [EX], DEL, INCR and INCRBY."""
+
+    def handle(self):
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.wfile.write(self.server.execute(command))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            raise ValueError("inline commands are not supported")
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+        self.lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args) -> bytes:
+        name = args[0].upper()
+        with self.lock:
+            if name == b"PING":
+                return b"+PONG\r\n"
+            if name == b"GET":
+                value = self._get(args[1])
+                return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+            if name == b"SET":
+                expires = None
+                if len(args) >= 5 and args[3].upper() == b"EX":
+                    expires = time.monotonic() + int(args[4])
+                self.data[args[1]] = (args[2], expires)
+                return b"+OK\r\n"
+            if name == b"DEL":
+                return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args[1:])
+            if name in (b"INCR", b"INCRBY"):
+                entry = self._get(args[1])
+                value = int(entry or 0) + (int(args[2]) if name == b"INCRBY" else 1)
+                self.data[args[1]] = (str(value).encode(), None)
+                return b":%d\r\n" % value
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,26 @@
+# tests/helpers.py
+
+import uuid
+from app import main
+
+def admin_headers(client) -> dict:
+    """Creates a fresh admin user and returns the Authorization header for it."""
+    username, password = f"admin-{uuid.uuid4().hex}", "secret"
+    db = main.database.SessionLocal()
+    try:
+        main.crud.create_user(db, main.schemas.UserCreate(username=username, password=password))
+    finally:
+        db.close()
+    token = client.post("/token", data={"username": username, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def customer_payload(**overrides) -> dict:
+    return {
+        "full_name": "Maria Silva",
+        "contact_email": "maria@example.com",
+        "birthdate": "1985-04-12",
+        "passport_number": uuid.uuid4().hex,
+        "country_of_origin": "Portugal",
+        "denied_visa": False,
+        **overrides
+    }
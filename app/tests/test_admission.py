@@ -0,0 +1,44 @@
+# tests/test_admission.py
+
+import asyncio
+from app.sql_app.admission import AdmissionMiddleware, PoolWaitWindow
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def call(app):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app({"type": "http", "method": "GET", "path": "/partners", "headers": []}, receive, send))
+    return messages[0]["status"], dict(messages[0]["headers"])
+
+def test_admits_requests_under_the_thresholds():
+    assert call(AdmissionMiddleware(ok_app, waits=PoolWaitWindow()))[0] == 200
+
+def test_sheds_when_in_flight_limit_is_reached():
+    middleware = AdmissionMiddleware(ok_app, max_in_flight=2, retry_after=3, waits=PoolWaitWindow())
+    middleware.in_flight = 2
+    status, headers = call(middleware)
+    assert status == 503
+    assert headers[b"retry-after"] == b"3"
+
+def test_sheds_on_slow_pool_checkouts_until_the_window_passes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.sql_app.admission.time.monotonic", lambda: now[0])
+    waits = PoolWaitWindow(window=5)
+    middleware = AdmissionMiddleware(ok_app, max_pool_wait_ms=100, waits=waits)
+
+    waits.record(0.002)
+    waits.record(0.5)
+    assert call(middleware)[0] == 503
+
+    now[0] += 6
+    assert waits.average_ms() == 0
+    assert call(middleware)[0] == 200
@@ -0,0 +1,43 @@
+# tests/test_archival.py
+
+import uuid
+import pytest
+from sqlalchemy import text
+from app.sql_app import archival, database
+
+postgres_only = pytest.mark.skipif(database.engine.dialect.name != "postgresql", reason="Partitioning requires PostgreSQL")
+
+def test_a_failing_step_does_not_block_the_others(monkeypatch):
+    ran = []
+
+    def failing(db):
+        ran.append("ensure_partitions")
+        raise RuntimeError("updated partition constraint for default partition would be violated")
+
+    monkeypatch.setattr(archival, "ensure_partitions", failing)
+    monkeypatch.setattr(archival, "archive_buy_documents", lambda db: ran.append("archive_buy_documents") or 0)
+    monkeypatch.setattr(archival, "detach_old_partitions", lambda db: ran.append("detach_old_partitions") or [])
+
+    assert archival.run() is False
+    assert ran == ["ensure_partitions", "archive_buy_documents", "detach_old_partitions"]
+
+@postgres_only
+def test_partition_creation_moves_rows_out_of_the_default_partition():
+    parent = f"events_{uuid.uuid4().hex[:8]}"
+    db = database.SessionLocal()
+    try:
+        db.execute(text(f"CREATE TABLE {parent} (id INTEGER NOT NULL, created_at TIMESTAMP NOT NULL, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)"))
+        db.execute(text(f"CREATE TABLE {parent}_default PARTITION OF {parent} DEFAULT"))
+        db.execute(text(f"INSERT INTO {parent} VALUES (1, '2031-05-10'), (2, '2031-06-30 23:59'), (3, '2031-08-01')"))
+
+        db.execute(text("SELECT create_monthly_partitions(:parent, '2031-05-01', 2)"), {"parent": parent})
+        # Existing partitions are left alone
+        db.execute(text("SELECT create_monthly_partitions(:parent, '2031-05-01', 2)"), {"parent": parent})
+
+        located = dict(db.execute(text(f"SELECT id, tableoid::regclass::text FROM {parent}")).all())
+        assert located == {1: f"{parent}_2031_05", 2: f"{parent}_2031_06", 3: f"{parent}_default"}
+        db.execute(text(f"INSERT INTO {parent} VALUES (4, '2031-05-11')"))
+        assert db.execute(text(f"SELECT tableoid::regclass::text FROM {parent} WHERE id = 4")).scalar() == f"{parent}_2031_05"
+    finally:
+        db.rollback()
+        db.close()
@@ -0,0 +1,34 @@
+# tests/test_auth.py
+
+from datetime import timedelta
+import pytest
+from jose import JWTError
+from app.sql_app import auth
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    auth._token_cache.clear()
+    yield
+    auth._token_cache.clear()
+
+def test_repeated_tokens_are_decoded_once(monkeypatch):
+    token = auth.create_access_token({"sub": "admin"}, timedelta(minutes=5))
+    calls = []
+    decode = auth.jwt.decode
+    monkeypatch.setattr(auth.jwt, "decode", lambda *args, **kwargs: calls.append(1) or decode(*args, **kwargs))
+
+    assert auth.decode_access_token(token)["sub"] == "admin"
+    assert auth.decode_access_token(token)["sub"] == "admin"
+    assert len(calls) == 1
+
+def test_expired_tokens_are_rejected():
+    token = auth.create_access_token({"sub": "admin"}, timedelta(seconds=-1))
+    with pytest.raises(JWTError):
+        auth.decode_access_token(token)
+    assert not auth._token_cache
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(auth, "TOKEN_CACHE_SIZE", 2)
+    for user in ("a", "b", "c"):
+        auth.decode_access_token(auth.create_access_token({"sub": user}, timedelta(minutes=5)))
+    assert [payload["sub"] for payload in auth._token_cache.values()] == ["b", "c"]
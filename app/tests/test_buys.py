@@ -0,0 +1,59 @@
+# tests/test_buys.py
+
+from datetime import datetime
+from fastapi.testclient import TestClient
+from app.main import app
+from app.sql_app import database, models
+from app.tests.helpers import customer_payload
+
+client = TestClient(app)
+
+def create_buy(customer_id: int, **documents) -> dict:
+    response = client.post("/buys/", json={
+        "customer_id": customer_id, "surgery_id": 1, "tier_list_id": 1, "price": "1500€", "schengen_area": True,
+        **documents
+    })
+    assert response.status_code == 200
+    return response.json()
+
+def archive_documents(buy_id: int, created_at: datetime):
+    """Moves the documents of a buy to buy_documents_archive, the way the archiving job leaves old buys."""
+    db = database.SessionLocal()
+    try:
+        buy = db.query(models.Buy).filter(models.Buy.id == buy_id).one()
+        archive = models.BuyDocumentArchive(buy_id=buy_id)
+        for column in models.BUY_DOCUMENT_COLUMNS:
+            if hasattr(archive, column):
+                setattr(archive, column, getattr(buy, column))
+                setattr(buy, column, None)
+        buy.documents_archived = True
+        buy.created_at = created_at
+        db.add(archive)
+        db.commit()
+    finally:
+        db.close()
+
+def test_archived_documents_are_restored():
+    customer = client.post("/customers/", json=customer_payload(full_name="Archived Buyer")).json()
+    buy = create_buy(customer["id"], passport_copy="old passport", id_scan="old id")
+    archive_documents(buy["id"], datetime(2020, 1, 15))
+
+    restored = client.get(f"/buys/{buy['id']}").json()
+    assert restored["passport_copy"] == "old passport"
+    assert restored["id_scan"] == "old id"
+    assert restored["valid_photo"] is None
+
+def test_buys_by_customer_are_ordered_by_creation():
+    customer = client.post("/customers/", json=customer_payload(full_name="Repeat Buyer")).json()
+    recent = create_buy(customer["id"], passport_copy="new passport")
+    older = create_buy(customer["id"], passport_copy="second passport")
+    oldest = create_buy(customer["id"], passport_copy="first passport")
+    archive_documents(oldest["id"], datetime(2020, 1, 15))
+    archive_documents(older["id"], datetime(2021, 6, 1))
+
+    buys = client.get(f"/customers/{customer['id']}/buys/").json()
+    assert [buy["id"] for buy in buys] == [oldest["id"], older["id"], recent["id"]]
+    assert [buy["passport_copy"] for buy in buys] == ["first passport", "second passport", "new passport"]
+
+    page = client.get(f"/customers/{customer['id']}/buys/", params={"skip": 1, "limit": 1}).json()
+    assert [buy["id"] for buy in page] == [older["id"]]
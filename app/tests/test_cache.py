@@ -0,0 +1,91 @@
+# tests/test_cache.py
+
+import time
+import pytest
+from app.sql_app import cache
+from app.tests.fake_redis import FakeRedisServer, unused_port
+
+@pytest.fixture
+def redis_server():
+    with FakeRedisServer() as server:
+        yield server
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request, monkeypatch):
+    if request.param == "memory":
+        backend = cache.MemoryCacheBackend()
+    else:
+        backend = cache.RedisCacheBackend(request.getfixturevalue("redis_server").url)
+    monkeypatch.setattr(cache, "backend", backend)
+    return backend
+
+def test_backend_round_trip(backend):
+    assert backend.get("missing") is None
+    backend.set("key", b"value")
+    assert backend.get("key") == b"value"
+    assert backend.incr("counter") == 1
+    assert backend.incr("counter") == 2
+    backend.delete("key")
+    assert backend.get("key") is None
+
+def test_memory_entries_expire(monkeypatch):
+    backend = cache.MemoryCacheBackend()
+    now = time.monotonic()
+    backend.set("key", b"value", ttl=10)
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now + 11)
+    assert backend.get("key") is None
+
+def test_get_or_set_stores_once_and_skips_none(backend):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return b'[{"id": 1}]'
+
+    assert cache.get_or_set(cache.CATALOG, ("/partners", 0, 100), load) == b'[{"id": 1}]'
+    assert cache.get_or_set(cache.CATALOG, ("/partners", 0, 100), load) == b'[{"id": 1}]'
+    assert len(calls) == 1
+
+    assert cache.get_or_set(cache.CATALOG, ("/surgeries/{surgery_id}", 404), lambda: None) is None
+    assert cache.get_or_set(cache.CATALOG, ("/surgeries/{surgery_id}", 404), lambda: b"{}") == b"{}"
+
+def test_invalidate_only_orphans_its_namespace(backend):
+    cache.get_or_set(cache.CATALOG, ("/partners",), lambda: b"old")
+    cache.get_or_set(cache.USERS, ("admin",), lambda: b"user")
+
+    cache.invalidate(cache.CATALOG)
+
+    assert cache.get_or_set(cache.CATALOG, ("/partners",), lambda: b"new") == b"new"
+    assert cache.get_or_set(cache.USERS, ("admin",), lambda: b"other") == b"user"
+
+def test_replicas_share_entries_and_invalidation(redis_server, monkeypatch):
+    first, second = cache.RedisCacheBackend(redis_server.url), cache.RedisCacheBackend(redis_server.url)
+
+    monkeypatch.setattr(cache, "backend", first)
+    cache.get_or_set(cache.CATALOG, ("/tier-lists",), lambda: b"v1")
+    monkeypatch.setattr(cache, "backend", second)
+    assert cache.get_or_set(cache.CATALOG, ("/tier-lists",), lambda: b"unused") == b"v1"
+
+    cache.invalidate(cache.CATALOG)
+    monkeypatch.setattr(cache, "backend", first)
+    assert cache.get_or_set(cache.CATALOG, ("/tier-lists",), lambda: b"v2") == b"v2"
+
+def test_unreachable_backend_falls_back_to_load(monkeypatch):
+    monkeypatch.setattr(cache, "backend", cache.RedisCacheBackend(f"redis://127.0.0.1:{unused_port()}/0"))
+    assert cache.get_or_set(cache.CATALOG, ("/partners",), lambda: b"fresh") == b"fresh"
+    cache.invalidate(cache.CATALOG)
+
+def test_create_backend():
+    assert cache.create_backend("none") is None
+    assert isinstance(cache.create_backend("memory://"), cache.MemoryCacheBackend)
+    assert isinstance(cache.create_backend("redis://localhost:6379/0"), cache.RedisCacheBackend)
+    with pytest.raises(ValueError):
+        cache.create_backend("memcached://localhost")
+
+def test_backends_must_implement_every_operation():
+    class GetOnly(cache.CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
@@ -0,0 +1,62 @@
+# tests/test_cancellation.py
+
+import asyncio, sqlite3, threading, time
+import pytest
+from app.sql_app.cancellation import CancelOnDisconnectMiddleware, DisconnectWatcher, SCOPE_KEY
+
+SLOW_QUERY = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+
+def test_cancel_interrupts_running_query():
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    watcher = DisconnectWatcher()
+    watcher.track(connection)
+    threading.Timer(0.1, watcher.cancel).start()
+
+    started = time.perf_counter()
+    with pytest.raises(sqlite3.OperationalError, match="interrupted"):
+        connection.execute(SLOW_QUERY).fetchall()
+    assert time.perf_counter() - started < 5
+    assert watcher.cancelled
+
+def test_released_and_finished_connections_are_left_alone():
+    class Connection:
+        cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    released, held = Connection(), Connection()
+    watcher = DisconnectWatcher()
+    watcher.track(released)
+    watcher.track(held)
+    watcher.untrack(released)
+    watcher.cancel()
+    assert held.cancelled and not released.cancelled
+
+    finished = DisconnectWatcher()
+    finished.track(held := Connection())
+    finished.finish()
+    finished.cancel()
+    assert not held.cancelled and not finished.cancelled
+
+def test_disconnect_cancels_the_request_queries():
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+
+    async def app(scope, receive, send):
+        scope[SCOPE_KEY].track(connection)
+        await asyncio.to_thread(lambda: connection.execute(SLOW_QUERY).fetchall())
+
+    async def run():
+        messages = asyncio.Queue()
+        messages.put_nowait({"type": "http.request", "body": b"", "more_body": False})
+        asyncio.get_running_loop().call_later(0.1, messages.put_nowait, {"type": "http.disconnect"})
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/customers/", "headers": []}
+        await asyncio.wait_for(CancelOnDisconnectMiddleware(app)(scope, messages.get, send), 5)
+        return sent
+
+    assert asyncio.run(run())[0]["status"] == 499
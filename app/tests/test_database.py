@@ -0,0 +1,73 @@
+# tests/test_database.py
+
+import time
+import pytest
+from types import SimpleNamespace
+from sqlalchemy import create_engine, exc, text
+from app.sql_app import database
+from app.sql_app.admission import PoolWaitWindow
+
+def make_request(cookies=None):
+    return SimpleNamespace(cookies=cookies or {}, scope={"path": "/customers/"})
+
+def test_reads_use_primary_without_replicas(monkeypatch):
+    monkeypatch.setattr(database, "replica_engines", [])
+    db = next(database.get_read_db(make_request()))
+    assert db.get_bind() is database.engine
+
+def test_reads_use_replica_unless_pinned(monkeypatch, tmp_path):
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    monkeypatch.setattr(database, "replica_engines", [replica])
+    monkeypatch.setattr(database, "_replica_cycle", iter([replica] * 2))
+
+    assert next(database.get_read_db(make_request())).get_bind() is replica
+
+    pinned = make_request({database.PRIMARY_PIN_COOKIE: str(time.time() + 5)})
+    assert next(database.get_read_db(pinned)).get_bind() is database.engine
+
+    expired = make_request({database.PRIMARY_PIN_COOKIE: str(time.time() - 5)})
+    assert next(database.get_read_db(expired)).get_bind() is replica
+
+def test_parse_statement_timeouts():
+    assert database.parse_statement_timeouts(
+        "/customers/{customer_id}/buys/=2000, /files/{file_id} = 10000,,/partners=,=500"
+    ) == {"/customers/{customer_id}/buys/": 2000, "/files/{file_id}": 10000}
+    assert database.parse_statement_timeouts("") == {}
+
+def test_statement_timeout_falls_back_to_default(monkeypatch):
+    monkeypatch.setattr(database, "STATEMENT_TIMEOUTS", {"/files/{file_id}": 10000})
+    assert database.statement_timeout_for("/files/{file_id}") == 10000
+    assert database.statement_timeout_for("/partners") == database.DEFAULT_STATEMENT_TIMEOUT_MS
+
+def test_connection_is_checked_out_on_first_query(monkeypatch):
+    waits = PoolWaitWindow()
+    monkeypatch.setattr(database.admission, "pool_waits", waits)
+    sessions = database.get_db(make_request())
+    db = next(sessions)
+
+    assert not db.in_transaction()
+    assert len(waits._samples) == 0
+
+    db.execute(text("SELECT 1"))
+    db.execute(text("SELECT 1"))
+    assert len(waits._samples) == 1
+    db.commit()
+    db.execute(text("SELECT 1"))
+    assert len(waits._samples) == 2
+    sessions.close()
+
+def test_timed_out_checkout_counts_as_pool_wait(monkeypatch, tmp_path):
+    waits = PoolWaitWindow()
+    monkeypatch.setattr(database.admission, "pool_waits", waits)
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=0, pool_timeout=0.2)
+    held = engine.connect()
+    db = database.SessionLocal(bind=engine)
+    db.info[database.MEASURE_POOL_WAIT] = True
+    try:
+        with pytest.raises(exc.TimeoutError):
+            db.execute(text("SELECT 1"))
+    finally:
+        db.close()
+        held.close()
+
+    assert waits.average_ms() >= 200
@@ -0,0 +1,59 @@
+# tests/test_export.py
+
+import csv, io, json
+from fastapi.testclient import TestClient
+from app.main import app
+from app.tests.helpers import admin_headers, customer_payload
+
+client = TestClient(app)
+
+def create_buy() -> dict:
+    customer = client.post("/customers/", json=customer_payload(full_name="Export Buyer")).json()
+    return client.post("/buys/", json={
+        "customer_id": customer["id"], "surgery_id": 1, "tier_list_id": 1, "price": "1500€",
+        "schengen_area": True, "passport_copy": "scan bytes", "id_scan": "scan bytes"
+    }).json()
+
+def test_export_requires_authentication():
+    assert client.get("/export/customers").status_code == 401
+
+def test_customers_ndjson():
+    customer = client.post("/customers/", json=customer_payload(full_name="Export Customer")).json()
+    response = client.get("/export/customers", headers=admin_headers(client))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    exported = next(row for row in rows if row["id"] == customer["id"])
+    assert exported["full_name"] == "Export Customer"
+    assert exported["birthdate"] == "1985-04-12"
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+def test_customers_csv_has_header_row():
+    client.post("/customers/", json=customer_payload(full_name="Csv Customer"))
+    response = client.get("/export/customers", params={"format": "csv"}, headers=admin_headers(client))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == "attachment; filename=customers.csv"
+    reader = csv.DictReader(io.StringIO(response.text))
+    assert reader.fieldnames == [
+        "id", "full_name", "contact_email", "birthdate", "national_id_number",
+        "passport_number", "tin_number", "country_of_origin", "denied_visa"
+    ]
+    assert "Csv Customer" in [row["full_name"] for row in reader]
+
+def test_buys_leave_out_document_columns():
+    buy = create_buy()
+    headers = admin_headers(client)
+
+    rows = [json.loads(line) for line in client.get("/export/buys", headers=headers).text.splitlines()]
+    exported = next(row for row in rows if row["id"] == buy["id"])
+    assert set(exported) == {"id", "customer_id", "surgery_id", "tier_list_id", "price", "schengen_area", "created_at"}
+    assert exported["price"] == "1500€"
+
+    header = client.get("/export/buys", params={"format": "csv"}, headers=headers).text.splitlines()[0]
+    assert header == "id,customer_id,surgery_id,tier_list_id,price,schengen_area,created_at"
+
+def test_unknown_format_is_rejected():
+    assert client.get("/export/buys", params={"format": "xml"}, headers=admin_headers(client)).status_code == 422
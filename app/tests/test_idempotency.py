@@ -0,0 +1,64 @@
+# tests/test_idempotency.py
+
+import uuid
+from datetime import timedelta
+from fastapi.testclient import TestClient
+from app.main import app
+from app.sql_app import idempotency
+from app.tests.helpers import admin_headers, customer_payload
+
+client = TestClient(app)
+
+def test_retry_replays_stored_response():
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    first = client.post("/customers/", json=customer_payload(), headers=headers)
+    # The retry carries a different body on purpose: it must not be parsed or inserted
+    retry = client.post("/customers/", json=customer_payload(), headers=headers)
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+
+def test_requests_without_key_are_not_deduplicated():
+    first = client.post("/customers/", json=customer_payload())
+    second = client.post("/customers/", json=customer_payload())
+    assert first.json()["id"] != second.json()["id"]
+
+def test_lapsed_lease_is_taken_over_and_the_old_owner_is_fenced_off(monkeypatch):
+    key, method, path = uuid.uuid4().hex, "POST", "/customers/"
+    assert idempotency.claim(key, method, path, "dead-worker") == (idempotency.CLAIMED, None)
+    assert idempotency.claim(key, method, path, "retry")[0] == idempotency.IN_PROGRESS
+
+    later = idempotency._utcnow() + timedelta(seconds=idempotency.IDEMPOTENCY_LEASE_SECONDS + 1)
+    monkeypatch.setattr(idempotency, "_utcnow", lambda: later)
+    assert idempotency.claim(key, method, path, "retry") == (idempotency.CLAIMED, None)
+
+    # The original request cannot renew, complete or release a key it no longer owns
+    assert not idempotency.renew(key, method, path, "dead-worker")
+    idempotency.complete(key, method, path, "dead-worker", 200, [], b"stale")
+    idempotency.release(key, method, path, "dead-worker")
+    assert idempotency.claim(key, method, path, "third")[0] == idempotency.IN_PROGRESS
+    assert idempotency.renew(key, method, path, "retry")
+
+def test_retry_after_a_dead_worker_is_processed(monkeypatch):
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    # Simulates a worker that died after claiming the key: the lease already lapsed
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LEASE_SECONDS", -1)
+    idempotency.claim(headers["Idempotency-Key"], "POST", "/customers/", "dead-worker")
+    monkeypatch.undo()
+
+    response = client.post("/customers/", json=customer_payload(), headers=headers)
+    assert response.status_code == 200
+    assert "idempotent-replayed" not in response.headers
+
+def test_profiled_request_stores_its_real_response():
+    key = uuid.uuid4().hex
+    profiled = client.post("/customers/", json=customer_payload(), headers={**admin_headers(client), "Idempotency-Key": key, "X-Profile": "1"})
+    assert profiled.status_code == 200
+    assert profiled.json()["path"] == "/customers/"
+
+    retry = client.post("/customers/", json=customer_payload(), headers={"Idempotency-Key": key})
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json()["full_name"] == "Maria Silva"
+    assert "id" in retry.json()
@@ -0,0 +1,95 @@
+# tests/test_imports.py
+
+import io, json, uuid
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.sql_app import database, models
+from app.sql_app.imports import iter_customers
+from app.tests.helpers import admin_headers, customer_payload
+
+client = TestClient(app)
+postgres_only = pytest.mark.skipif(database.engine.dialect.name != "postgresql", reason="COPY import requires PostgreSQL")
+
+def ndjson(*records) -> bytes:
+    return "\n".join(record if isinstance(record, str) else json.dumps(record) for record in records).encode()
+
+def test_rows_violating_table_constraints_are_reported_per_line():
+    file = io.BytesIO(ndjson(
+        customer_payload(),
+        customer_payload(country_of_origin="PT"),
+        customer_payload(full_name="x" * 256),
+        "{not json",
+        customer_payload(passport_number="p" * 300),
+    ))
+    results = list(iter_customers(file, "customers.ndjson", "application/x-ndjson"))
+
+    assert [line for line, customer, error in results if customer is not None] == [1]
+    errors = {line: error for line, customer, error in results if error}
+    assert set(errors) == {2, 3, 4, 5}
+    assert "country_of_origin" in errors[2]
+    assert errors[3].startswith("full_name")
+    assert errors[4].startswith("Invalid JSON")
+    assert errors[5].startswith("passport_number")
+
+def test_csv_empty_cells_are_missing_values():
+    file = io.BytesIO(
+        b"full_name,contact_email,birthdate,national_id_number,passport_number,tin_number,country_of_origin,denied_visa\n"
+        b"Ana Costa,ana@example.com,1990-02-03,,,,Portugal,false\n"
+    )
+    [(line, customer, error)] = iter_customers(file, "customers.csv", "text/csv")
+    assert (line, error) == (2, None)
+    assert customer.passport_number is None
+
+@pytest.mark.skipif(database.engine.dialect.name == "postgresql", reason="SQLite fallback")
+def test_import_requires_postgresql():
+    response = client.post(
+        "/customers/import", headers=admin_headers(client),
+        files={"file": ("customers.ndjson", ndjson(customer_payload()), "application/x-ndjson")}
+    )
+    assert response.status_code == 501
+
+@postgres_only
+def test_import_reports_bad_rows_and_duplicates_without_failing_the_file():
+    duplicate = uuid.uuid4().hex
+    response = client.post(
+        "/customers/import", headers=admin_headers(client),
+        files={"file": ("customers.ndjson", ndjson(
+            customer_payload(passport_number=duplicate),
+            customer_payload(country_of_origin="PT"),
+            customer_payload(passport_number=duplicate),
+            customer_payload(),
+        ), "application/x-ndjson")}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["inserted"] == 2
+    assert [error["line"] for error in report["errors"]] == [2, 3]
+
+@postgres_only
+def test_import_keeps_empty_strings_and_quotes():
+    passports = [uuid.uuid4().hex for _ in range(3)]
+    response = client.post(
+        "/customers/import", headers=admin_headers(client),
+        files={"file": ("customers.ndjson", ndjson(
+            customer_payload(full_name="", passport_number=passports[0]),
+            customer_payload(contact_email="", passport_number=passports[1]),
+            customer_payload(full_name='Ana "Nita", Costa', contact_email=r"\N", passport_number=passports[2]),
+        ), "application/x-ndjson")}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"inserted": 3, "errors": []}
+
+    db = database.SessionLocal()
+    try:
+        customers = {
+            customer.passport_number: customer
+            for customer in db.query(models.Customer).filter(models.Customer.passport_number.in_(passports))
+        }
+    finally:
+        db.close()
+    assert customers[passports[0]].full_name == ""
+    assert customers[passports[1]].contact_email == ""
+    assert customers[passports[2]].full_name == 'Ana "Nita", Costa'
+    assert customers[passports[2]].contact_email == r"\N"
+    assert customers[passports[2]].tin_number is None
@@ -0,0 +1,65 @@
+# tests/test_logs.py
+
+import asyncio, json, logging, queue
+from fastapi.testclient import TestClient
+from app.main import app
+from app.sql_app import logs
+from app.sql_app.admission import AdmissionMiddleware, PoolWaitWindow
+
+client = TestClient(app)
+
+def test_request_id_is_echoed_or_generated():
+    response = client.get("/", headers={"X-Request-ID": "abc123"})
+    assert response.headers["x-request-id"] == "abc123"
+    assert client.get("/").headers["x-request-id"]
+
+def test_longest_prefix_sample_rate_wins(monkeypatch):
+    monkeypatch.setattr(logs, "_sample_rates", logs.parse_sample_rates("/surgeries=0.5,/surgeries/summary=0.1,/partners=0"))
+    assert logs.sample_rate("/surgeries/summary") == 0.1
+    assert logs.sample_rate("/surgeries/3") == 0.5
+    assert logs.sample_rate("/partners") == 0
+    assert logs.sample_rate("/customers/") == logs.LOG_SAMPLE_RATE
+
+def test_queued_records_keep_their_exception():
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger("test_logs.queued")
+    handler = logs.ExcInfoQueueHandler(log_queue)
+    logger.addHandler(handler)
+    try:
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("Failed for %s", "customer 7")
+    finally:
+        logger.removeHandler(handler)
+
+    entry = json.loads(logs.JsonFormatter().format(log_queue.get_nowait()))
+    assert entry["message"] == "Failed for customer 7"
+    assert "ZeroDivisionError" in entry["exc_info"]
+
+async def failing_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 500, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+def access_lines(app, caplog) -> list:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="access"):
+        asyncio.run(logs.AccessLogMiddleware(app)({"type": "http", "method": "GET", "path": "/partners", "headers": []}, receive, send))
+    return [record for record in caplog.records if record.name == "access"]
+
+def test_errors_bypass_sampling_but_shed_requests_do_not(monkeypatch, caplog):
+    monkeypatch.setattr(logs, "_sample_rates", logs.parse_sample_rates("/partners=0"))
+    assert [record.status_code for record in access_lines(failing_app, caplog)] == [500]
+
+    shedding = AdmissionMiddleware(failing_app, max_in_flight=1, waits=PoolWaitWindow())
+    shedding.in_flight = 1
+    assert access_lines(shedding, caplog) == []
+
+    monkeypatch.setattr(logs, "_sample_rates", logs.parse_sample_rates("/partners=1"))
+    assert [record.status_code for record in access_lines(shedding, caplog)] == [503]
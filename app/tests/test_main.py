@@ -1,11 +1,99 @@
 # tests/test_main.py
 
+import time
+from types import SimpleNamespace
 from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from app import main
 from app.main import app
+from app.tests.helpers import admin_headers, customer_payload
 
 client = TestClient(app)
 
 def test_read_main():
     response = client.get("/")
     assert response.status_code == 200
-    assert response.json() == {"message": "Hello World"}
\ No newline at end of file
+    assert response.json() == {"message": "Hello World"}
+
+def test_profile_flag_requires_admin():
+    response = client.get("/?profile=1", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    assert response.json() == {"message": "Hello World"}
+
+def test_customer_list_is_built_from_projected_rows():
+    created = client.post("/customers/", json={
+        "full_name": "Ana Costa",
+        "contact_email": "ana@example.com",
+        "birthdate": "1990-02-03",
+        "country_of_origin": "Portugal",
+        "denied_visa": True
+    }).json()
+    response = client.get("/customers/", params={"limit": 10000})
+    assert response.status_code == 200
+    assert created in response.json()
+    assert [customer["id"] for customer in response.json()] == sorted(customer["id"] for customer in response.json())
+
+def slowed(fn):
+    # Long enough for the 1 ms sampler to see the caller's frames
+    def slow(*args, **kwargs):
+        time.sleep(0.02)
+        return fn(*args, **kwargs)
+    return slow
+
+def test_admin_profile_samples_the_endpoint_thread_and_times_serialization(monkeypatch):
+    monkeypatch.setattr(main.crud, "get_customers", slowed(main.crud.get_customers))
+    monkeypatch.setattr(main.crud, "get_partner_lists", slowed(main.crud.get_partner_lists))
+    headers = {**admin_headers(client), "X-Profile": "1"}
+    client.post("/customers/", json=customer_payload())
+
+    profile = client.get("/customers/", headers=headers).json()
+    assert profile["status_code"] == 200
+    assert profile["sql"]["count"] >= 1
+    assert "read_customers" in profile["endpoint_profile"]
+    assert profile["serialization_ms"] > 0
+
+    profile = client.get("/partners", headers=headers).json()
+    assert "load_json" in profile["endpoint_profile"]
+    assert profile["serialization_ms"] > 0
+
+    # response_model routes are serialized by FastAPI after the endpoint returns
+    profile = client.get("/users/me/", headers=headers).json()
+    assert profile["status_code"] == 200
+    assert profile["serialization_ms"] > 0
+
+def test_profile_flag_needs_an_explicit_value():
+    headers = admin_headers(client)
+    for value in ("0", "false", "no", ""):
+        assert client.get("/", params={"profile": value}, headers=headers).json() == {"message": "Hello World"}
+        assert client.get("/", headers={**headers, "X-Profile": value}).json() == {"message": "Hello World"}
+    for value in ("1", "true", "JSON"):
+        assert "profile" in client.get("/", params={"profile": value}, headers=headers).json()
+    assert client.get("/", headers={**headers, "X-Profile": "html"}).headers["content-type"].startswith("text/html")
+
+def query_error(pgcode: str) -> OperationalError:
+    return OperationalError("SELECT", {}, SimpleNamespace(pgcode=pgcode))
+
+def test_statement_timeout_answers_503(monkeypatch):
+    def timed_out(db, customer_id):
+        raise query_error("57014")
+
+    monkeypatch.setattr(main.crud, "get_customer", timed_out)
+    response = client.get("/customers/1")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(main.admission.ADMISSION_RETRY_AFTER_SECONDS)
+    assert response.json() == {"detail": "Database query timed out"}
+
+def test_query_cancelled_after_disconnect_answers_499(monkeypatch):
+    def cancelled(db, customer_id):
+        db.info[main.cancellation.SCOPE_KEY].cancelled = True
+        raise query_error("57014")
+
+    monkeypatch.setattr(main.crud, "get_customer", cancelled)
+    assert client.get("/customers/1").status_code == 499
+
+def test_other_operational_errors_are_server_errors(monkeypatch):
+    def deadlocked(db, customer_id):
+        raise query_error("40P01")
+
+    monkeypatch.setattr(main.crud, "get_customer", deadlocked)
+    assert TestClient(app, raise_server_exceptions=False).get("/customers/1").status_code == 500
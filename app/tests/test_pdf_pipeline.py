@@ -0,0 +1,165 @@
+# tests/test_pdf_pipeline.py
+
+import json, time
+from concurrent.futures import Future
+from fastapi.testclient import TestClient
+from app.main import app
+from app.sql_app import database, models, pdf_pipeline
+from app.tests.helpers import admin_headers
+
+client = TestClient(app)
+
+PNG = b"\x89PNG\r\n\x1a\nthumbnail"
+RESULT = {
+    "page_count": 2,
+    "pdf_metadata": json.dumps({"title": "Quote"}),
+    "text_content": "Quote for a hair transplant",
+    "thumbnail": PNG,
+}
+
+def upload(content: bytes = b"%PDF-1.4 quote") -> dict:
+    response = client.post("/upload/", files={"file": ("quote.pdf", content, "application/pdf")})
+    assert response.status_code == 200
+    return response.json()
+
+def other_jobs(job_id: int) -> frozenset:
+    """Every other job, so claim_job only sees the one under test whatever earlier tests left behind."""
+    db = database.SessionLocal()
+    try:
+        return frozenset(id for (id,) in db.query(models.PDFJob.id).filter(models.PDFJob.id != job_id))
+    finally:
+        db.close()
+
+def get_job(job_id: int) -> models.PDFJob:
+    db = database.SessionLocal()
+    try:
+        return db.query(models.PDFJob).filter(models.PDFJob.id == job_id).one()
+    finally:
+        db.close()
+
+def test_claim_job_marks_the_job_running():
+    uploaded = upload(b"%PDF-1.4 claimed")
+
+    assert pdf_pipeline.claim_job(other_jobs(uploaded["job_id"])) == (uploaded["job_id"], b"%PDF-1.4 claimed")
+    job = get_job(uploaded["job_id"])
+    assert job.status == pdf_pipeline.RUNNING
+    assert job.attempts == 1
+    # Still running and not stale, so nobody claims it again
+    assert pdf_pipeline.claim_job(other_jobs(uploaded["job_id"])) is None
+
+def test_claim_job_skips_excluded_jobs():
+    uploaded = upload()
+
+    assert pdf_pipeline.claim_job(other_jobs(uploaded["job_id"]) | {uploaded["job_id"]}) is None
+    assert get_job(uploaded["job_id"]).status == pdf_pipeline.PENDING
+
+def test_finish_job_stores_the_result():
+    uploaded = upload()
+    headers = admin_headers(client)
+
+    status = client.get(f"/files/{uploaded['file_id']}/status", headers=headers).json()
+    assert status["status"] == pdf_pipeline.PENDING
+    assert status["page_count"] is None
+    assert client.get(f"/files/{uploaded['file_id']}/thumbnail", headers=headers).status_code == 404
+
+    pdf_pipeline.claim_job(other_jobs(uploaded["job_id"]))
+    pdf_pipeline.finish_job(uploaded["job_id"], result=RESULT)
+
+    status = client.get(f"/files/{uploaded['file_id']}/status", headers=headers).json()
+    assert status["status"] == pdf_pipeline.DONE
+    assert status["attempts"] == 1
+    assert status["page_count"] == 2
+    assert status["pdf_metadata"] == {"title": "Quote"}
+    assert status["processed_at"] is not None
+    thumbnail = client.get(f"/files/{uploaded['file_id']}/thumbnail", headers=headers)
+    assert thumbnail.status_code == 200
+    assert thumbnail.headers["content-type"] == "image/png"
+    assert thumbnail.content == PNG
+
+def test_file_status_requires_authentication():
+    uploaded = upload()
+    assert client.get(f"/files/{uploaded['file_id']}/status").status_code == 401
+    assert client.get(f"/files/{uploaded['file_id']}/thumbnail").status_code == 401
+
+def test_file_status_unknown_file():
+    assert client.get("/files/999999/status", headers=admin_headers(client)).status_code == 404
+
+def test_finish_job_requeues_failures_until_the_last_attempt():
+    uploaded = upload()
+
+    for attempt in range(1, pdf_pipeline.PDF_JOB_MAX_ATTEMPTS + 1):
+        assert pdf_pipeline.claim_job(other_jobs(uploaded["job_id"]))[0] == uploaded["job_id"]
+        pdf_pipeline.finish_job(uploaded["job_id"], error="not a PDF")
+        job = get_job(uploaded["job_id"])
+        assert job.attempts == attempt
+        assert job.error == "not a PDF"
+
+    assert job.status == pdf_pipeline.FAILED
+    assert pdf_pipeline.claim_job(other_jobs(uploaded["job_id"])) is None
+
+def test_finish_job_retry_does_not_use_up_an_attempt():
+    uploaded = upload()
+    pdf_pipeline.claim_job(other_jobs(uploaded["job_id"]))
+
+    pdf_pipeline.finish_job(uploaded["job_id"], error="Interrupted by a pool restart", retry=True)
+
+    job = get_job(uploaded["job_id"])
+    assert job.status == pdf_pipeline.PENDING
+    assert job.attempts == 0
+
+class FakeProcess:
+    def __init__(self):
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+class FakePool:
+    def __init__(self):
+        self._processes = {1: FakeProcess()}
+        self.shut_down = False
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+def test_timed_out_job_is_failed_and_the_pool_recycled():
+    worker = pdf_pipeline.PdfJobWorker(workers=2, timeout=60)
+    worker._new_pool = FakePool
+    old_pool = worker._pool = FakePool()
+    timed_out, interrupted = upload(), upload()
+    for uploaded, deadline in ((timed_out, time.monotonic() - 1), (interrupted, time.monotonic() + 60)):
+        pdf_pipeline.claim_job(other_jobs(uploaded["job_id"]))
+        worker._slots.acquire()
+        worker._running[uploaded["job_id"]] = deadline
+
+    worker._expire_timed_out_jobs()
+
+    assert old_pool._processes[1].terminated
+    assert old_pool.shut_down
+    assert worker._pool is not old_pool
+    assert worker._running == {}
+    job = get_job(timed_out["job_id"])
+    assert job.status == pdf_pipeline.PENDING
+    assert job.attempts == 1
+    assert job.error == "Timed out after 60 s"
+    job = get_job(interrupted["job_id"])
+    assert job.status == pdf_pipeline.PENDING
+    assert job.attempts == 0
+
+    # The killed future completes later and must not release its slot a second time
+    future = Future()
+    future.set_exception(RuntimeError("process terminated"))
+    worker._on_done(timed_out["job_id"], future)
+    assert worker._slots.acquire(blocking=False) and worker._slots.acquire(blocking=False)
+    assert not worker._slots.acquire(blocking=False)
+    assert get_job(timed_out["job_id"]).error == "Timed out after 60 s"
+
+def test_jobs_within_their_deadline_are_left_alone():
+    worker = pdf_pipeline.PdfJobWorker(workers=1, timeout=60)
+    pool = worker._pool = FakePool()
+    worker._running[123456] = time.monotonic() + 60
+
+    worker._expire_timed_out_jobs()
+
+    assert not pool.shut_down
+    assert 123456 in worker._running
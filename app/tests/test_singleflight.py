@@ -0,0 +1,37 @@
+# tests/test_singleflight.py
+
+import asyncio
+from app.sql_app.singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def load(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def run():
+        group = SingleFlight()
+        results = await asyncio.gather(*[group.do("key", load, 21) for _ in range(10)])
+        assert group.in_flight() == 0
+        return results
+
+    assert asyncio.run(run()) == [42] * 10
+    assert calls == [21]
+
+def test_errors_reach_every_caller_and_release_the_key():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def ok():
+        return "ok"
+
+    async def run():
+        group = SingleFlight()
+        results = await asyncio.gather(*[group.do("key", fail) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await group.do("key", ok) == "ok"
+
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+# tests/test_storage.py
+
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.sql_app import storage
+from app.tests.helpers import admin_headers
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+requires_zstd = pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")
+
+client = TestClient(app)
+
+DOCUMENT = b"%PDF-1.7\n" + b"visa application form " * 5000
+# User bytes that look like a stored value with an unknown codec marker
+LOOKALIKE = storage.MAGIC + b"\x07 not a stored value"
+
+@requires_zstd
+def test_zstd_round_trip():
+    encoded = storage.encode(DOCUMENT, "zstd")
+    assert encoded.startswith(storage.MAGIC + bytes([storage.CODEC_ZSTD]))
+    assert len(encoded) < len(DOCUMENT)
+    assert storage.decode(encoded) == DOCUMENT
+    assert b"".join(storage.iter_decoded(encoded, chunk_size=1024)) == DOCUMENT
+
+@requires_zstd
+def test_encoded_values_are_stored_as_they_are():
+    encoded = storage.encode(DOCUMENT, "zstd")
+    assert isinstance(encoded, storage.Encoded)
+    assert storage.CompressedBinary().process_bind_param(encoded, None) == encoded
+
+@requires_zstd
+def test_legacy_and_incompressible_rows_pass_through():
+    noise = bytes(range(256)) * 4
+    assert storage.decode(DOCUMENT) == DOCUMENT
+    assert storage.encode(DOCUMENT, "none") == DOCUMENT
+    assert storage.encode(noise[:64], "zstd") == noise[:64]
+
+@pytest.mark.parametrize("codec", ["none", pytest.param("zstd", marks=requires_zstd)])
+def test_values_that_start_with_magic_are_escaped(codec):
+    encoded = storage.encode(LOOKALIKE, codec)
+    assert encoded == storage.MAGIC + bytes([storage.CODEC_RAW]) + LOOKALIKE
+    assert storage.decode(encoded) == LOOKALIKE
+    assert b"".join(storage.iter_decoded(encoded, chunk_size=4)) == LOOKALIKE
+
+def test_upload_round_trips_bytes_that_start_with_magic():
+    response = client.post("/upload/", files={"file": ("lookalike.pdf", LOOKALIKE, "application/pdf")})
+    assert response.status_code == 200
+
+    download = client.get(f"/files/{response.json()['file_id']}", headers=admin_headers(client))
+    assert download.status_code == 200
+    assert download.content == LOOKALIKE
+
+def test_buy_documents_round_trip_bytes_that_start_with_magic():
+    customer = client.post("/customers/", json={
+        "full_name": "Magic Bytes", "contact_email": "magic@example.com", "birthdate": "1980-01-01",
+        "country_of_origin": "Portugal", "denied_visa": False
+    }).json()
+    buy = client.post("/buys/", json={
+        "customer_id": customer["id"], "surgery_id": 1, "tier_list_id": 1, "price": "1500€", "schengen_area": True,
+        "passport_copy": LOOKALIKE.decode("latin-1")
+    })
+    assert buy.status_code == 200
+    assert client.get(f"/buys/{buy.json()['id']}").json()["passport_copy"] == LOOKALIKE.decode("latin-1")
@@ -0,0 +1,83 @@
+# tests/test_surgery_summary.py
+
+import threading, uuid
+from decimal import Decimal
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import text
+from app.sql_app import crud, database, models
+
+postgres_only = pytest.mark.skipif(database.engine.dialect.name != "postgresql", reason="surgery_summary is a PostgreSQL materialized view")
+
+class FakeRefreshSession:
+    """Counts refreshes; the first one blocks until released."""
+
+    def __init__(self, started: threading.Event, release: threading.Event, refreshes: list):
+        self.started, self.release, self.refreshes = started, release, refreshes
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+    def execute(self, statement):
+        self.refreshes.append(str(statement))
+        if len(self.refreshes) == 1:
+            self.started.set()
+            self.release.wait(5)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_writes_during_a_refresh_are_folded_into_one_more_refresh(monkeypatch):
+    started, release, refreshes = threading.Event(), threading.Event(), []
+    monkeypatch.setattr(crud, "SessionLocal", lambda: FakeRefreshSession(started, release, refreshes))
+
+    first = threading.Thread(target=crud.refresh_surgery_summary)
+    first.start()
+    assert started.wait(5)
+    # These return straight away: the running refresh picks their change up with one more pass
+    for _ in range(5):
+        crud.refresh_surgery_summary()
+    release.set()
+    first.join(5)
+
+    assert refreshes == ["REFRESH MATERIALIZED VIEW CONCURRENTLY surgery_summary"] * 2
+
+@postgres_only
+@pytest.mark.parametrize("price, expected", [
+    ("12000€", Decimal("12000")),
+    ("1.500€", Decimal("1500")),
+    ("1,500.50 EUR", Decimal("1500.50")),
+    ("1.500,50 €", Decimal("1500.50")),
+    ("on request", None),
+])
+def test_parse_price(price, expected):
+    with database.engine.connect() as connection:
+        assert connection.execute(text("SELECT parse_price(:price)"), {"price": price}).scalar() == expected
+
+@postgres_only
+def test_summary_has_the_tier_price_range():
+    db = database.SessionLocal()
+    try:
+        partner = models.Partner(company_name=f"Clinic {uuid.uuid4().hex[:8]}", website="w", help_type="h", small_description="s", large_description="l")
+        db.add(partner)
+        db.flush()
+        surgery = models.Surgery(surgery="Implants", surgery_description="d", partner_id=partner.id)
+        db.add(surgery)
+        db.flush()
+        for tier, price in (("Silver", "1.500€"), ("Gold", "12000€")):
+            db.add(models.TierList(
+                tier=tier, surgery_id=surgery.id, visa_sponsorship="v", flight_type="f", number_family_members="1",
+                hospital_accommodations="h", hotel="h", duration_stay="d", tourism_package="t",
+                post_surgery_monitoring="p", price=price
+            ))
+        db.commit()
+        crud.refresh_surgery_summary()
+
+        summary = next(row for row in crud.get_surgery_summaries(db, limit=100000) if row["id"] == surgery.id)
+        assert summary["partner_name"] == partner.company_name
+        assert (summary["min_price"], summary["max_price"], summary["tier_count"]) == (1500, 12000, 2)
+    finally:
+        db.close()